@@ -2,5 +2,11 @@
 """`nested_dict` provides dictionaries with multiple levels of nested-ness."""
 __version__ = '1.61'
 from .implementation import nested_dict
+from .flat import flat_nested_dict
+from .sorted import sorted_nested_dict
+from .array import array_nested_dict
+from .disk import disk_nested_dict
+from .concurrent import concurrent_nested_dict
 
-__all__ = ('nested_dict', )
+__all__ = ('nested_dict', 'flat_nested_dict', 'sorted_nested_dict', 'array_nested_dict',
+           'disk_nested_dict', 'concurrent_nested_dict', )
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""Asynchronous iteration and JSON output of nested dictionaries, for asyncio event loops."""
+from __future__ import print_function
+from __future__ import division
+
+################################################################################
+#
+#   _async.py
+#
+#   Copyright (c) 2009, 2015 Leo Goodstadt
+#
+#   Permission is hereby granted, free of charge, to any person obtaining a copy
+#   of this software and associated documentation files (the "Software"), to deal
+#   in the Software without restriction, including without limitation the rights
+#   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#   copies of the Software, and to permit persons to whom the Software is
+#   furnished to do so, subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be included in
+#   all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+#   THE SOFTWARE.
+#
+#################################################################################
+
+#
+#   Kept apart from implementation.py, which must still import under Python 2:
+#   async generators need Python 3.6 or later.
+#
+import asyncio
+
+from itertools import islice
+
+
+async def aiter_batches(iterable, yield_every):
+    """
+    Asynchronously iterate through iterable.
+
+    Control is given back to the event loop after every yield_every items.
+    """
+    if yield_every < 1:
+        raise ValueError("yield_every should be at least 1, not %r" % (yield_every,))
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, yield_every))
+        for item in batch:
+            yield item
+        if len(batch) < yield_every:
+            return
+        await asyncio.sleep(0)
+
+
+async def awrite_chunks(chunks, writer, encoding='utf-8'):
+    """
+    Write chunks of text, e.g. of JSON from iter_json_chunks(), to writer.
+
+    writer is e.g. an ``asyncio.StreamWriter``. Each chunk is encoded and written, then
+    ``writer.drain()`` awaited and control given back to the event loop.
+    """
+    for chunk in chunks:
+        writer.write(chunk.encode(encoding))
+        await writer.drain()
+        # drain() returns at once while the buffer is below its limit
+        await asyncio.sleep(0)
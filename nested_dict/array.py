@@ -0,0 +1,336 @@
+#!/usr/bin/env python
+"""`array_nested_dict` holds the numeric values of its innermost level in NumPy arrays."""
+from __future__ import print_function
+from __future__ import division
+
+################################################################################
+#
+#   array.py
+#
+#   Copyright (c) 2009, 2015 Leo Goodstadt
+#
+#   Permission is hereby granted, free of charge, to any person obtaining a copy
+#   of this software and associated documentation files (the "Software"), to deal
+#   in the Software without restriction, including without limitation the rights
+#   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#   copies of the Software, and to permit persons to whom the Software is
+#   furnished to do so, subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be included in
+#   all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+#   THE SOFTWARE.
+#
+#################################################################################
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .implementation import iteritems, itervalues
+from .flat import _flat_view
+
+
+#
+#   Slot numbers are shared between all innermost levels, so that each value costs
+#   only its 8 bytes in the array and a reference in the key -> slot dict
+#
+_slot_numbers = []
+
+
+def _slot_number(slot):
+    if slot >= len(_slot_numbers):
+        _slot_numbers.extend(range(len(_slot_numbers), 2 * slot + 64))
+    return _slot_numbers[slot]
+
+
+class _array_level(object):
+    """
+    The innermost level of an `array_nested_dict`.
+
+    ``slots`` maps each key to its position in the growable ``values`` array. Slots of
+    deleted keys are zeroed and reused.
+    """
+
+    __slots__ = ('slots', 'values', 'size', 'free')
+
+    def __init__(self, dtype):
+        self.slots = dict()
+        self.values = numpy.zeros(4, dtype)
+        self.size = 0
+        self.free = None
+
+    def slot(self, key):
+        """Return the slot for key, allocating a (zeroed) slot if necessary."""
+        slot = self.slots.get(key)
+        if slot is not None:
+            return slot
+        if self.free:
+            slot = self.free.pop()
+        else:
+            slot = _slot_number(self.size)
+            self.size += 1
+            if self.size > len(self.values):
+                grown = numpy.zeros(2 * len(self.values), self.values.dtype)
+                grown[:slot] = self.values[:slot]
+                self.values = grown
+        self.slots[key] = slot
+        return slot
+
+    def remove(self, key):
+        """Remove key, raising KeyError if it is missing."""
+        slot = self.slots.pop(key)
+        self.values[slot] = 0
+        if self.free is None:
+            self.free = []
+        self.free.append(slot)
+
+
+class _array_view(_flat_view):
+    """An intermediate level of an `array_nested_dict`."""
+
+    __slots__ = ()
+
+    def add_many(self, paths, values):
+        """
+        Add each of values to the value for the corresponding sequence of keys in paths.
+
+        values can be a single number or a sequence or array as long as paths.
+        Missing values are created (as zero) first. Repeated paths are added up.
+        """
+        self._root._add_many(self._prefix, paths, values)
+
+    def subtree_sum(self, prefix=()):
+        """Return the sum of all values below the sequence of keys in prefix."""
+        return self._root._subtree_sum(self._prefix + tuple(prefix))
+
+    def to_arrays(self):
+        """
+        Return ``(keys, values)``.
+
+        ``keys`` is a list of flattened key tuples (as for ``keys_flat()``) and ``values``
+        the NumPy array of the corresponding values.
+        """
+        return self._root._to_arrays(self._prefix)
+
+
+class array_nested_dict(_array_view):
+    """
+    Nested dict of numbers with a fixed number of levels.
+
+    Each innermost level is a ``dict`` of keys to positions in a NumPy array, rather
+    than a ``defaultdict`` of boxed Python numbers. As for ``nested_dict(levels, int)``,
+    missing values are created as zero on access.
+    """
+
+    __slots__ = ('levels', 'dtype', '_tree')
+
+    # class of the views returned for intermediate levels
+    _view_type = _array_view
+
+    def __init__(self, levels, dtype=float):
+        """
+        Create an empty dictionary with a fixed number of levels, of numbers of one dtype.
+
+        :param levels: the (fixed) number of nested levels
+        :param dtype: NumPy data type of the values
+        """
+        if numpy is None:
+            raise ImportError("array_nested_dict requires numpy")
+        if not isinstance(levels, int) or levels < 1:
+            raise Exception("array_nested_dict should be initialised with the number of nested "
+                            "levels and an optional dtype (levels = %r)" % (levels,))
+        _array_view.__init__(self, self, ())
+        self.levels = levels
+        self.dtype = numpy.dtype(dtype)
+        self._tree = self._new_node(0)
+
+    def _new_node(self, depth):
+        if depth == self.levels - 1:
+            return _array_level(self.dtype)
+        return dict()
+
+    #
+    #   Storage primitives
+    #
+    def _find(self, prefix):
+        """
+        Return the dict or `_array_level` for prefix, or None.
+
+        The walk stops at the innermost level, whose keys are looked up in its slots: for
+        the path to a value, return the `_array_level` holding it (if present), and for
+        longer prefixes, None.
+        """
+        innermost = self.levels - 1
+        if len(prefix) > self.levels:
+            return None
+        node = self._tree
+        for depth, key in enumerate(prefix):
+            if depth == innermost:
+                return node if key in node.slots else None
+            node = node.get(key)
+            if node is None:
+                return None
+        return node
+
+    def _level(self, parent_path):
+        """Return the `_array_level` for parent_path, creating levels as necessary."""
+        node = self._tree
+        for depth, key in enumerate(parent_path):
+            child = node.get(key)
+            if child is None:
+                child = node[key] = self._new_node(depth + 1)
+            node = child
+        return node
+
+    def _get(self, path, default):
+        level = self._find(path[:-1])
+        if level is None:
+            return default
+        slot = level.slots.get(path[-1])
+        if slot is None:
+            return default
+        return level.values.item(slot)
+
+    def _get_leaf(self, path):
+        level = self._level(path[:-1])
+        return level.values.item(level.slot(path[-1]))
+
+    def _set(self, path, value):
+        level = self._level(path[:-1])
+        slot = level.slot(path[-1])
+        level.values[slot] = value
+
+    def _del(self, path):
+        nodes = [self._tree]
+        for key in path[:-1]:
+            node = nodes[-1].get(key)
+            if node is None:
+                raise KeyError(path[-1])
+            nodes.append(node)
+        try:
+            nodes[-1].remove(path[-1])
+        except KeyError:
+            raise KeyError(path[-1])
+        self._prune(path, nodes)
+
+    def _prune(self, path, nodes):
+        """Remove levels along path left empty, so that only levels with values exist."""
+        for depth in range(len(nodes) - 1, 0, -1):
+            node = nodes[depth]
+            if (node.slots if depth == self.levels - 1 else node):
+                break
+            del nodes[depth - 1][path[depth - 1]]
+
+    def _iter_levels(self, prefix):
+        """Iterate through (path, `_array_level`) for all innermost levels below prefix."""
+        if len(prefix) >= self.levels:
+            # below the innermost levels
+            return
+        node = self._find(prefix)
+        if node is None:
+            return
+        stack = [(prefix, node)]
+        innermost = self.levels - 1
+        while stack:
+            path, node = stack.pop()
+            if len(path) == innermost:
+                yield path, node
+                continue
+            for key, child in iteritems(node):
+                stack.append((path + (key,), child))
+
+    def _iter_prefix(self, prefix):
+        if len(prefix) == self.levels:
+            # the path to a value
+            level = self._find(prefix)
+            if level is not None:
+                yield prefix, level.values.item(level.slots[prefix[-1]])
+            return
+        for path, level in self._iter_levels(prefix):
+            values = level.values.tolist()
+            for key, slot in iteritems(level.slots):
+                yield path + (key,), values[slot]
+
+    def _has_prefix(self, prefix):
+        return self._find(prefix) is not None
+
+    def _del_prefix(self, prefix):
+        if not prefix:
+            found = bool(self._tree if self.levels > 1 else self._tree.slots)
+            self._tree = self._new_node(0)
+            return found
+        nodes = [self._tree]
+        for key in prefix[:-1]:
+            node = nodes[-1].get(key)
+            if node is None:
+                return False
+            nodes.append(node)
+        if nodes[-1].pop(prefix[-1], None) is None:
+            return False
+        self._prune(prefix, nodes)
+        return True
+
+    #
+    #   Vectorised operations
+    #
+    def _add_many(self, prefix, paths, values):
+        values = numpy.asarray(values, self.dtype)
+        # add up repeated paths first, in one pass through numpy
+        unique_paths = dict()
+        if prefix:
+            paths = (prefix + tuple(path) for path in paths)
+        positions = [unique_paths.setdefault(path, len(unique_paths)) for path in paths]
+        if values.ndim and len(values) != len(positions):
+            raise ValueError("add_many() was given %d paths but %d values"
+                             % (len(positions), len(values)))
+        totals = numpy.zeros(len(unique_paths), self.dtype)
+        numpy.add.at(totals, positions, values)
+
+        # group slots (and positions in values) by innermost level
+        groups = dict()
+        parent_levels = self.levels - 1
+        for path, position in iteritems(unique_paths):
+            parent = path[:-1]
+            group = groups.get(parent)
+            if group is None:
+                if len(parent) != parent_levels:
+                    raise ValueError("array_nested_dict with %d levels cannot hold key %r"
+                                     % (self.levels, path))
+                group = groups[parent] = (self._level(parent), [], [])
+            level, slots, group_positions = group
+            slot = level.slots.get(path[-1])
+            if slot is None:
+                slot = level.slot(path[-1])
+            slots.append(slot)
+            group_positions.append(position)
+        for level, slots, group_positions in itervalues(groups):
+            level.values[slots] += totals[group_positions]
+
+    def _subtree_sum(self, prefix):
+        if len(prefix) == self.levels:
+            return self._get(prefix, self.dtype.type(0).item())
+        total = self.dtype.type(0)
+        for path, level in self._iter_levels(prefix):
+            total += level.values[:level.size].sum()
+        return total.item()
+
+    def _to_arrays(self, prefix):
+        depth = len(prefix)
+        keys = []
+        parts = []
+        for path, level in self._iter_levels(prefix):
+            path = path[depth:]
+            slots = list(level.slots.values())
+            keys.extend(path + (key,) for key in level.slots)
+            parts.append(level.values[slots])
+        if not parts:
+            return keys, numpy.zeros(0, self.dtype)
+        return keys, numpy.concatenate(parts)
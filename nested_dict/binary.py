@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+"""Binary snapshot files of nested dictionaries, which can be read one top level key at a time."""
+from __future__ import print_function
+from __future__ import division
+
+################################################################################
+#
+#   binary.py
+#
+#   Copyright (c) 2009, 2015 Leo Goodstadt
+#
+#   Permission is hereby granted, free of charge, to any person obtaining a copy
+#   of this software and associated documentation files (the "Software"), to deal
+#   in the Software without restriction, including without limitation the rights
+#   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#   copies of the Software, and to permit persons to whom the Software is
+#   furnished to do so, subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be included in
+#   all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+#   THE SOFTWARE.
+#
+#################################################################################
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+from collections import defaultdict
+
+import mmap
+import os
+import pickle
+import struct
+
+from .implementation import (_flatten_tree, _unflatten_tree, _new_level, _untracked_class_and_state,
+                             _frozen_nested_dict, _is_nested_type, _recursive_dict,
+                             flatten_nested_items, iteritems, nested_dict)
+
+#
+#   File layout:
+#
+#       MAGIC
+#       one record per top level key: pickled (size, key numbers, flags, values) from
+#           _flatten_tree() for nested levels, or the pickled value
+#       key table: pickled list of all the keys below the top level, each once
+#       index: pickled (class, default factory, state, key table offset,
+#           [(top level key, is nested, record offset, record length), ...])
+#       index offset, MAGIC
+#
+MAGIC = b'nested_dict binary 1\n'
+_offset = struct.Struct('<Q')
+_protocol = pickle.HIGHEST_PROTOCOL
+
+
+def save_binary(nd, filename):
+    """Write nd to filename as a binary snapshot for mapped_nested_dict."""
+    key_numbers = dict()
+    index = []
+    with open(filename, 'wb') as snapshot:
+        snapshot.write(MAGIC)
+        position = len(MAGIC)
+        for top_key, value in iteritems(nd):
+            # other mappings are values, as for pickling
+            is_nested = isinstance(value, _recursive_dict)
+            if is_nested:
+                keys, flags, values = _flatten_tree(value)
+                numbers = [key_numbers.setdefault(key, len(key_numbers)) for key in keys]
+                record = pickle.dumps((len(value), numbers, bytes(flags), values), _protocol)
+            else:
+                record = pickle.dumps(value, _protocol)
+            snapshot.write(record)
+            index.append((top_key, is_nested, position, len(record)))
+            position += len(record)
+
+        key_table = [None] * len(key_numbers)
+        for key, number in iteritems(key_numbers):
+            key_table[number] = key
+        key_table_offset = position
+        key_table = pickle.dumps(key_table, _protocol)
+        snapshot.write(key_table)
+        position += len(key_table)
+
+        cls, state = _untracked_class_and_state(nd)
+        snapshot.write(pickle.dumps((cls, nd.default_factory, state, key_table_offset, index),
+                                    _protocol))
+        snapshot.write(_offset.pack(position))
+        snapshot.write(MAGIC)
+
+
+def _unflatten_frozen(size, keys, flags, values):
+    """As _unflatten_tree(), but building frozen levels, which cannot be changed."""
+    stack = []
+    items = []
+    remaining = size
+    for key, is_nested, value in zip(keys, flags, values):
+        while not remaining:
+            frozen = _frozen_nested_dict(items)
+            parent_key, items, remaining = stack.pop()
+            items.append((parent_key, frozen))
+        remaining -= 1
+        if not is_nested:
+            items.append((key, value))
+            continue
+        stack.append((key, items, remaining))
+        items = []
+        remaining = value
+    while stack:
+        frozen = _frozen_nested_dict(items)
+        parent_key, items, remaining = stack.pop()
+        items.append((parent_key, frozen))
+    return _frozen_nested_dict(items)
+
+
+class mapped_nested_dict(Mapping):
+    """
+    Read-only nested dictionary backed by a memory mapped binary snapshot (see nested_dict.save).
+
+    Opening the file only reads the index of top level keys and the table of keys. Each top
+    level key's nested levels are decoded from the file when first accessed, and kept as
+    frozen (read-only) levels, so that they cannot be changed through the snapshot.
+
+    The file is read with pickle, so only files from trusted sources should be opened.
+    """
+
+    __slots__ = ('_file', '_map', '_key_table', '_index', '_template', '_decoded')
+
+    def __init__(self, filename):
+        """
+        Open a file for reading, mapped into memory.
+
+        :param filename: a file written by nested_dict.save()
+        """
+        self._map = None
+        self._file = open(filename, 'rb')
+        try:
+            self._open(filename)
+        except Exception:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+            self._file.close()
+            raise
+        self._decoded = dict()
+
+    def _open(self, filename):
+        """Check the file is a snapshot, map it and read the index and the table of keys."""
+        snapshot = self._file
+        size = os.fstat(snapshot.fileno()).st_size
+        # (mmap cannot map an empty file)
+        if size < 2 * len(MAGIC) + _offset.size:
+            raise ValueError("%s is not a nested_dict binary snapshot" % (filename,))
+        start = snapshot.read(len(MAGIC))
+        snapshot.seek(size - len(MAGIC))
+        if start != MAGIC or snapshot.read(len(MAGIC)) != MAGIC:
+            raise ValueError("%s is not a nested_dict binary snapshot" % (filename,))
+        self._map = mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ)
+        trailer = size - len(MAGIC)
+        index_offset, = _offset.unpack(self._map[trailer - _offset.size:trailer])
+        cls, default_factory, state, key_table_offset, index = pickle.loads(
+            self._map[index_offset:trailer - _offset.size])
+        self._key_table = pickle.loads(self._map[key_table_offset:index_offset])
+        self._index = dict((top_key, (is_nested, offset, length))
+                           for top_key, is_nested, offset, length in index)
+        # empty dictionary with the levels of the dictionary saved
+        self._template = _unflatten_tree(cls, default_factory, state, 0, (), (), ())
+
+    def close(self):
+        """Close the file."""
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+            self._map = None
+
+    def __enter__(self):
+        """Return self, for use in a ``with`` block."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Close the file when leaving a ``with`` block."""
+        self.close()
+
+    def __getitem__(self, key):
+        """Return the value or (frozen) nested level for key, read on first access."""
+        value = self._decoded.get(key, self._decoded)
+        if value is not self._decoded:
+            return value
+        is_nested, offset, length = self._index[key]
+        record = pickle.loads(self._map[offset:offset + length])
+        if not is_nested:
+            return record
+        size, numbers, flags, values = record
+        key_table = self._key_table
+        value = self._decoded[key] = _unflatten_frozen(size,
+                                                       [key_table[number] for number in numbers],
+                                                       bytearray(flags), values)
+        return value
+
+    def _decode(self, key):
+        """Decode the value of top level key afresh, with nested levels as saved."""
+        is_nested, offset, length = self._index[key]
+        record = pickle.loads(self._map[offset:offset + length])
+        if is_nested:
+            size, numbers, flags, values = record
+            key_table = self._key_table
+            level = _new_level(self._template)
+            if isinstance(level, defaultdict):
+                cls, state = _untracked_class_and_state(level)
+                factory = level.default_factory
+            else:
+                cls, state, factory = nested_dict, None, nested_dict
+            value = _unflatten_tree(cls, factory, state, size,
+                                    [key_table[number] for number in numbers],
+                                    bytearray(flags), values)
+        else:
+            value = record
+        return value
+
+    def __iter__(self):
+        """Iterate through the keys at the top level."""
+        return iter(self._index)
+
+    def __len__(self):
+        """Return the number of keys at the top level."""
+        return len(self._index)
+
+    def __contains__(self, key):
+        """Return whether key is at the top level, without reading its value."""
+        return key in self._index
+
+    def iteritems_flat(self):
+        """Iterate through items with nested keys flattened into a tuple."""
+        for top_key in self._index:
+            value = self[top_key]
+            if _is_nested_type(value.__class__):
+                for path, nested_value in flatten_nested_items(value):
+                    yield (top_key,) + path, nested_value
+            else:
+                yield (top_key,), value
+
+    def iterkeys_flat(self):
+        """Iterate through keys with nested keys flattened into a tuple."""
+        for path, value in self.iteritems_flat():
+            yield path
+
+    def itervalues_flat(self):
+        """Iterate through values with nested keys flattened into a tuple."""
+        for path, value in self.iteritems_flat():
+            yield value
+
+    items_flat = iteritems_flat
+    keys_flat = iterkeys_flat
+    values_flat = itervalues_flat
+
+    def load(self):
+        """Return the whole snapshot as a new nested_dict (as saved), decoded afresh."""
+        cls, state = _untracked_class_and_state(self._template)
+        nd = _unflatten_tree(cls, self._template.default_factory, state, 0, (), (), ())
+        for top_key in self._index:
+            nd[top_key] = self._decode(top_key)
+        return nd
+
+    def to_dict(self):
+        """Convert to a nested series of standard ``dict`` objects."""
+        return self.load().to_dict()
+
+    def __repr__(self):
+        """Representation of self, with all the values read."""
+        return "%s(%r)" % (self.__class__.__name__, self.to_dict())
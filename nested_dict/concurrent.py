@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+"""`concurrent_nested_dict` can be read and written from many threads at once."""
+from __future__ import print_function
+from __future__ import division
+
+################################################################################
+#
+#   concurrent.py
+#
+#   Copyright (c) 2009, 2015 Leo Goodstadt
+#
+#   Permission is hereby granted, free of charge, to any person obtaining a copy
+#   of this software and associated documentation files (the "Software"), to deal
+#   in the Software without restriction, including without limitation the rights
+#   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#   copies of the Software, and to permit persons to whom the Software is
+#   furnished to do so, subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be included in
+#   all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+#   THE SOFTWARE.
+#
+#################################################################################
+
+from collections import defaultdict
+
+import threading
+
+from .implementation import _recursive_dict, _iter_items, nested_dict
+
+
+class _concurrent_mapping(object):
+    """
+    Mixin for nested levels whose missing keys are added atomically.
+
+    ``defaultdict.__missing__`` calls the (Python) level factory and then sets the new
+    level, so two threads can each create a level for the same key, and one level (with
+    everything already put in it) is lost. Here the new level is only put in with
+    ``setdefault``, so both threads carry on with whichever level got there first.
+    """
+
+    __slots__ = ()
+
+    def __missing__(self, key):
+        factory = self.default_factory
+        if factory is None:
+            raise KeyError(key)
+        return self.setdefault(key, factory())
+
+
+class _concurrent_level(_concurrent_mapping, _recursive_dict):
+    """A nested level of a `concurrent_nested_dict`."""
+
+
+class _concurrent_levels_factory(object):
+    """
+    Wraps the factory of a nested level so that it makes `_concurrent_level` instead.
+
+    Whether the factory makes nested levels or values (and the factory of the levels
+    below) is found out from the first object it makes.
+    """
+
+    __slots__ = ('factory', 'nested', 'child_factory')
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.nested = None
+        self.child_factory = None
+
+    def __call__(self):
+        if self.nested is None:
+            value = self.factory()
+            if not isinstance(value, defaultdict):
+                self.nested = False
+                return value
+            child_factory = value.default_factory
+            if child_factory is self.factory:
+                self.child_factory = self
+            elif child_factory is not None:
+                self.child_factory = _concurrent_levels_factory(child_factory)
+            self.nested = True
+        if self.nested:
+            return _concurrent_level(self.child_factory)
+        return self.factory()
+
+    def __reduce__(self):
+        return (self.__class__, (self.factory,))
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, self.factory)
+
+
+def _make_concurrent(nd):
+    """Switch the nested levels below nd (e.g. copied from a dict) to `_concurrent_level`."""
+    stack = [nd]
+    while stack:
+        for key, value in _iter_items(stack.pop()):
+            if isinstance(value, _recursive_dict):
+                if value.__class__ is not _concurrent_level:
+                    value.__class__ = _concurrent_level
+                    if value.default_factory is not None:
+                        value.default_factory = _concurrent_levels_factory(value.default_factory)
+                stack.append(value)
+
+
+#
+#   Serialises creating the locks of dictionaries unpickled or copied without them
+#
+_new_locks_lock = threading.Lock()
+
+
+class concurrent_nested_dict(_concurrent_mapping, nested_dict):
+    """
+    Nested dict which can be read and written from many threads at once.
+
+    Missing nested levels and values are added atomically, so that no thread's writes
+    are lost when several threads create the same level at once. Reads of existing
+    keys take no locks.
+
+    ``incr_path()``, ``set_path()``, ``setdefault_path()`` and ``del_path()`` are atomic:
+    they hold one of ``stripes`` locks, chosen by the hash of the top level key, so that
+    writes below different top level keys seldom wait for each other. Other changes
+    (``nd[a][b] += 1``, ``update()``, ``merge()``...) are not atomic.
+    """
+
+    __slots__ = ('_locks',)
+
+    def __init__(self, *param, **named_param):
+        """
+        Create a nested dictionary which can be written to from several threads.
+
+        Takes the same parameters as ``nested_dict``, and optionally ``stripes``, the
+        number of locks (64 by default).
+        """
+        self.stripes = named_param.pop("stripes", 64)
+        nested_dict.__init__(self, *param, **named_param)
+        self.default_factory = _concurrent_levels_factory(self.factory)
+        _make_concurrent(self)
+        self._locks = [threading.Lock() for stripe in range(self.stripes)]
+
+    def _lock(self, key):
+        """Return the lock for the top level key."""
+        try:
+            locks = self._locks
+        except AttributeError:
+            # unpickled or copied
+            with _new_locks_lock:
+                try:
+                    locks = self._locks
+                except AttributeError:
+                    locks = self._locks = [threading.Lock() for stripe in range(self.stripes)]
+        return locks[hash(key) % len(locks)]
+
+    def incr_path(self, path, amount=1):
+        """
+        Add amount to the value for the sequence of keys in `path` and return the sum.
+
+        Missing levels are created, and a missing value counts as 0.
+        """
+        key = path[-1]
+        with self._lock(path[0]):
+            node = self
+            for parent_key in path[:-1]:
+                node = node[parent_key]
+            value = node[key] = dict.get(node, key, 0) + amount
+        return value
+
+    def set_path(self, path, value):
+        """Set the value for the sequence of keys in `path`, creating missing levels."""
+        with self._lock(path[0]):
+            nested_dict.set_path(self, path, value)
+
+    def setdefault_path(self, path, default=None):
+        """Return the value for `path` if present, else set it to default and return default."""
+        with self._lock(path[0]):
+            return nested_dict.setdefault_path(self, path, default)
+
+    def del_path(self, path):
+        """Delete the value for the sequence of keys in `path`. Raise KeyError if missing."""
+        if not path:
+            raise KeyError(path)
+        with self._lock(path[0]):
+            nested_dict.del_path(self, path)
@@ -0,0 +1,331 @@
+#!/usr/bin/env python
+"""`disk_nested_dict` keeps a nested dictionary in an SQLite database, keyed by path."""
+from __future__ import print_function
+from __future__ import division
+
+################################################################################
+#
+#   disk.py
+#
+#   Copyright (c) 2009, 2015 Leo Goodstadt
+#
+#   Permission is hereby granted, free of charge, to any person obtaining a copy
+#   of this software and associated documentation files (the "Software"), to deal
+#   in the Software without restriction, including without limitation the rights
+#   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#   copies of the Software, and to permit persons to whom the Software is
+#   furnished to do so, subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be included in
+#   all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+#   THE SOFTWARE.
+#
+#################################################################################
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    # python 2.6
+    OrderedDict = None
+
+import marshal
+import pickle
+import sqlite3
+import struct
+import sys
+
+from .implementation import iteritems
+from .flat import _flat_view
+
+
+_missing = object()
+_deleted = object()
+
+#
+#   Values of these types cannot be changed in place, so need not be written back
+#   after being read
+#
+_immutable_types = frozenset([int, float, complex, bool, str, bytes, tuple, frozenset,
+                              type(None)])
+
+_key_length = struct.Struct('>I')
+
+if sys.hexversion < 0x03000000:
+    # sqlite3 binds 8-bit str as text (and refuses it): bind encoded bytes as blobs
+    _blob = sqlite3.Binary
+else:
+    def _blob(data):
+        return data
+
+
+def _encode_path(path):
+    """
+    Encode a tuple of keys as bytes, in which the encoding of a prefix is a prefix.
+
+    Then all the levels below a level are a range of rows.
+    """
+    parts = []
+    for key in path:
+        encoded = marshal.dumps(key, 2)
+        parts.append(_key_length.pack(len(encoded)))
+        parts.append(encoded)
+    return b''.join(parts)
+
+
+def _decode_path(encoded):
+    path = []
+    position = 0
+    end = len(encoded)
+    while position < end:
+        length, = _key_length.unpack_from(encoded, position)
+        position += 4
+        path.append(marshal.loads(encoded[position:position + length]))
+        position += length
+    return tuple(path)
+
+
+def _prefix_range(prefix):
+    """Return the (lower, upper) bounds of the encoded paths starting with prefix."""
+    lower = _encode_path(prefix)
+    upper = bytearray(lower)
+    while upper[-1] == 255:
+        upper.pop()
+    upper[-1] += 1
+    return _blob(lower), _blob(bytes(upper))
+
+
+class disk_nested_dict(_flat_view):
+    """
+    Nested dict with a fixed number of levels, kept in an SQLite database.
+
+    Each value is a row keyed by the (encoded) path to its innermost level and its key,
+    so that all the values below a level are a range of rows. As for `flat_nested_dict`,
+    intermediate levels are views created on access. Innermost levels are read from the
+    database a whole level at a time when first accessed, and kept in a least recently
+    used cache of cache_size levels. Writes are buffered and written batch_size at a time,
+    in a single transaction.
+    """
+
+    __slots__ = ('levels', 'leaf_type', 'cache_size', 'batch_size',
+                 '_connection', '_cache', '_pending', '_pending_count')
+
+    # class of the views returned for intermediate levels
+    _view_type = _flat_view
+
+    def __init__(self, filename, levels, leaf_type=None, cache_size=1024, batch_size=10000):
+        """
+        Open (or create) a dictionary kept in an SQLite database file.
+
+        :param filename: the SQLite database file, created if necessary
+        :param levels: the (fixed) number of nested levels
+        :param leaf_type: optional factory for missing leaves, as for ``nested_dict(levels, type)``
+        :param cache_size: the maximum number of innermost levels kept in memory
+        :param batch_size: the maximum number of writes kept in memory before writing them out
+        """
+        if OrderedDict is None:
+            raise ImportError("disk_nested_dict requires python 2.7 or later")
+        if not isinstance(levels, int) or levels < 1:
+            raise Exception("disk_nested_dict should be initialised with a file name, the number "
+                            "of nested levels and an optional type (levels = %r)" % (levels,))
+        _flat_view.__init__(self, self, ())
+        self.levels = levels
+        self.leaf_type = leaf_type
+        self.cache_size = cache_size
+        self.batch_size = batch_size
+        # innermost levels: parent path -> {key: value}
+        self._cache = OrderedDict()
+        # unwritten values (or _deleted): parent path -> {key: value}
+        self._pending = dict()
+        self._pending_count = 0
+
+        self._connection = sqlite3.connect(filename)
+        self._connection.execute("CREATE TABLE IF NOT EXISTS nested_dict_settings "
+                                 "(name TEXT PRIMARY KEY, value)")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS nested_dict "
+                                 "(parent BLOB, key BLOB, value BLOB, PRIMARY KEY (parent, key)) "
+                                 "WITHOUT ROWID")
+        row = self._connection.execute("SELECT value FROM nested_dict_settings "
+                                       "WHERE name = 'levels'").fetchone()
+        if row is None:
+            self._connection.execute("INSERT INTO nested_dict_settings VALUES ('levels', ?)",
+                                     (levels,))
+            self._connection.commit()
+        elif row[0] != levels:
+            self._connection.close()
+            raise ValueError("%s holds a nested dictionary with %d levels, not %d"
+                             % (filename, row[0], levels))
+
+    #
+    #   Writing out
+    #
+    def flush(self):
+        """Write all buffered changes to the database, in a single transaction."""
+        if not self._pending:
+            return
+        updates = []
+        deletes = []
+        dumps = pickle.dumps
+        protocol = pickle.HIGHEST_PROTOCOL
+        for parent, changes in iteritems(self._pending):
+            encoded_parent = _blob(_encode_path(parent))
+            for key, value in iteritems(changes):
+                encoded_key = _blob(marshal.dumps(key, 2))
+                if value is _deleted:
+                    deletes.append((encoded_parent, encoded_key))
+                else:
+                    updates.append((encoded_parent, encoded_key, _blob(dumps(value, protocol))))
+        with self._connection:
+            self._connection.executemany("DELETE FROM nested_dict WHERE parent = ? AND key = ?",
+                                         deletes)
+            self._connection.executemany("INSERT OR REPLACE INTO nested_dict VALUES (?, ?, ?)",
+                                         updates)
+        self._pending.clear()
+        self._pending_count = 0
+
+    def close(self):
+        """Write all buffered changes and close the database."""
+        if self._connection is not None:
+            self.flush()
+            self._connection.close()
+            self._connection = None
+            self._cache.clear()
+
+    def __del__(self):
+        """Write out changes and close the file, if still open."""
+        if getattr(self, "_connection", None) is not None:
+            self.close()
+
+    def __enter__(self):
+        """Return self, for use in a ``with`` block."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Write out changes and close the file when leaving a ``with`` block."""
+        self.close()
+
+    def _write(self, parent, key, value):
+        changes = self._pending.get(parent)
+        if changes is None:
+            changes = self._pending[parent] = dict()
+        if key not in changes:
+            self._pending_count += 1
+        changes[key] = value
+        if self._pending_count >= self.batch_size:
+            self.flush()
+
+    #
+    #   Innermost levels, read a level at a time
+    #
+    def _level(self, parent):
+        """Return the innermost level at parent as a dict, reading it if necessary."""
+        cache = self._cache
+        level = cache.pop(parent, None)
+        if level is None:
+            rows = self._connection.execute("SELECT key, value FROM nested_dict WHERE parent = ?",
+                                            (_blob(_encode_path(parent)),))
+            loads = pickle.loads
+            key_loads = marshal.loads
+            level = dict((key_loads(key), loads(value)) for key, value in rows)
+            for key, value in iteritems(self._pending.get(parent, {})):
+                if value is _deleted:
+                    level.pop(key, None)
+                else:
+                    level[key] = value
+            while cache and len(cache) >= self.cache_size:
+                cache.popitem(last=False)
+        cache[parent] = level
+        return level
+
+    #
+    #   Storage primitives, as for flat_nested_dict
+    #
+    def _get(self, path, default):
+        value = self._level(path[:-1]).get(path[-1], _missing)
+        if value is _missing:
+            return default
+        if value.__class__ not in _immutable_types:
+            # may be changed in place: write back
+            self._write(path[:-1], path[-1], value)
+        return value
+
+    def _get_leaf(self, path):
+        value = self._get(path, _missing)
+        if value is _missing:
+            if self.leaf_type is None:
+                raise KeyError(path[-1])
+            value = self.leaf_type()
+            self._set(path, value)
+        return value
+
+    def _set(self, path, value):
+        parent = path[:-1]
+        level = self._cache.get(parent)
+        if level is not None:
+            level[path[-1]] = value
+        self._write(parent, path[-1], value)
+
+    def _del(self, path):
+        level = self._level(path[:-1])
+        if path[-1] not in level:
+            raise KeyError(path[-1])
+        del level[path[-1]]
+        self._write(path[:-1], path[-1], _deleted)
+
+    def _iter_prefix(self, prefix):
+        if len(prefix) >= self.levels:
+            # the path to a value (or past it), not a range of parent levels
+            value = self._get(prefix, _missing) if len(prefix) == self.levels else _missing
+            return iter(() if value is _missing else ((prefix, value),))
+        self.flush()
+        return self._iter_rows(prefix)
+
+    def _iter_rows(self, prefix):
+        if prefix:
+            lower, upper = _prefix_range(prefix)
+            rows = self._connection.execute("SELECT parent, key, value FROM nested_dict "
+                                            "WHERE parent >= ? AND parent < ?", (lower, upper))
+        else:
+            rows = self._connection.execute("SELECT parent, key, value FROM nested_dict")
+        loads = pickle.loads
+        key_loads = marshal.loads
+        last_encoded = parent = None
+        for encoded, key, value in rows:
+            if encoded != last_encoded:
+                last_encoded = encoded
+                parent = _decode_path(encoded)
+            yield parent + (key_loads(key),), loads(value)
+
+    def _has_prefix(self, prefix):
+        if len(prefix) >= self.levels:
+            return len(prefix) == self.levels and prefix[-1] in self._level(prefix[:-1])
+        self.flush()
+        if not prefix:
+            row = self._connection.execute("SELECT 1 FROM nested_dict LIMIT 1").fetchone()
+        else:
+            lower, upper = _prefix_range(prefix)
+            row = self._connection.execute("SELECT 1 FROM nested_dict "
+                                           "WHERE parent >= ? AND parent < ? LIMIT 1",
+                                           (lower, upper)).fetchone()
+        return row is not None
+
+    def _del_prefix(self, prefix):
+        self.flush()
+        depth = len(prefix)
+        for parent in [parent for parent in self._cache if parent[:depth] == prefix]:
+            del self._cache[parent]
+        with self._connection:
+            if not prefix:
+                deleted = self._connection.execute("DELETE FROM nested_dict").rowcount
+            else:
+                lower, upper = _prefix_range(prefix)
+                deleted = self._connection.execute("DELETE FROM nested_dict "
+                                                   "WHERE parent >= ? AND parent < ?",
+                                                   (lower, upper)).rowcount
+        return deleted > 0
@@ -0,0 +1,400 @@
+#!/usr/bin/env python
+"""`flat_nested_dict` stores all leaves of a nested dictionary in one tuple-keyed dict."""
+from __future__ import print_function
+from __future__ import division
+
+################################################################################
+#
+#   flat.py
+#
+#   Copyright (c) 2009, 2015 Leo Goodstadt
+#
+#   Permission is hereby granted, free of charge, to any person obtaining a copy
+#   of this software and associated documentation files (the "Software"), to deal
+#   in the Software without restriction, including without limitation the rights
+#   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#   copies of the Software, and to permit persons to whom the Software is
+#   furnished to do so, subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be included in
+#   all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+#   THE SOFTWARE.
+#
+#################################################################################
+
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
+
+from .implementation import flatten_nested_items, iteritems, _path_accessor
+
+
+_missing = object()
+
+
+class _flat_view(MutableMapping):
+    """
+    A lightweight view of one level of a `flat_nested_dict`.
+
+    Views hold no data: only a reference to the owning `flat_nested_dict` and
+    the tuple of keys leading to this level. They are created on the fly by
+    ``__getitem__`` so that ``nd[a][b][c]`` works as for ``nested_dict``.
+
+    Operations which need the keys of a level (iteration, ``len``, ``in``,
+    deletion of a subtree) go through the storage primitives of the owner
+    (``_iter_prefix``, ``_has_prefix``, ``_iter_keys``, ...).
+    """
+
+    __slots__ = ('_root', '_prefix')
+
+    def __init__(self, root, prefix):
+        self._root = root
+        self._prefix = prefix
+
+    #
+    #   Mapping interface
+    #
+    def __getitem__(self, key):
+        path = self._prefix + (key,)
+        root = self._root
+        if len(path) < root.levels:
+            return root._view_type(root, path)
+        return root._get_leaf(path)
+
+    def __setitem__(self, key, value):
+        path = self._prefix + (key,)
+        root = self._root
+        if len(path) == root.levels:
+            root._set(path, value)
+            return
+        if not hasattr(value, "keys"):
+            raise ValueError("flat_nested_dict with %d levels cannot hold %r at level %d"
+                             % (root.levels, value, len(path)))
+        items = [(path + sub_path, sub_value)
+                 for sub_path, sub_value in flatten_nested_items(value)]
+        for sub_path, sub_value in items:
+            if len(sub_path) != root.levels:
+                raise ValueError("flat_nested_dict with %d levels cannot hold key %r"
+                                 % (root.levels, sub_path))
+        root._del_prefix(path)
+        for sub_path, sub_value in items:
+            root._set(sub_path, sub_value)
+
+    def __delitem__(self, key):
+        path = self._prefix + (key,)
+        root = self._root
+        if len(path) == root.levels:
+            root._del(path)
+        elif not root._del_prefix(path):
+            raise KeyError(key)
+
+    def __iter__(self):
+        return self._root._iter_keys(self._prefix)
+
+    def __len__(self):
+        return self._root._len_keys(self._prefix)
+
+    def __contains__(self, key):
+        path = self._prefix + (key,)
+        root = self._root
+        if len(path) == root.levels:
+            return root._get(path, _missing) is not _missing
+        return root._has_prefix(path)
+
+    def get(self, key, default=None):
+        """Return the value or level view for key if present, else default (never vivifies)."""
+        if key in self:
+            return self[key]
+        return default
+
+    def clear(self):
+        """Remove all leaves below this level."""
+        self._root._del_prefix(self._prefix)
+
+    def __eq__(self, other):
+        if isinstance(other, _flat_view):
+            return dict(self.iteritems_flat()) == dict(other.iteritems_flat())
+        if hasattr(other, "keys"):
+            return self.to_dict() == other
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, self.to_dict())
+
+    #
+    #   Access by a sequence of keys: a single lookup in the flat storage
+    #
+    @property
+    def path(self):
+        """Accessor so that ``nd.path[a, b, c]`` indexes with a tuple of keys."""
+        return _path_accessor(self)
+
+    def get_path(self, path, default=None):
+        """Return the value (or level view) for the sequence of keys in `path`, or default."""
+        path = self._prefix + tuple(path)
+        root = self._root
+        if len(path) == root.levels:
+            return root._get(path, default)
+        if len(path) < root.levels and root._has_prefix(path):
+            return root._view_type(root, path)
+        return default
+
+    def has_path(self, path):
+        """Return whether the sequence of keys in `path` is present."""
+        return self.get_path(path, _missing) is not _missing
+
+    def set_path(self, path, value):
+        """Set the value for the sequence of keys in `path`."""
+        path = self._prefix + tuple(path)
+        root = self._root
+        if len(path) == root.levels:
+            root._set(path, value)
+        else:
+            root._view_type(root, path[:-1])[path[-1]] = value
+
+    def setdefault_path(self, path, default=None):
+        """Return the value for `path` if present, else set it to default and return default."""
+        path = self._prefix + tuple(path)
+        root = self._root
+        if len(path) != root.levels:
+            raise KeyError(path)
+        value = root._get(path, _missing)
+        if value is _missing:
+            root._set(path, default)
+            value = default
+        return value
+
+    def del_path(self, path):
+        """Delete the value or level for the sequence of keys in `path`."""
+        full_path = self._prefix + tuple(path)
+        try:
+            self._root._view_type(self._root, full_path[:-1]).__delitem__(full_path[-1])
+        except KeyError:
+            raise KeyError(tuple(path))
+
+    #
+    #   Same flat / conversion API as _recursive_dict
+    #
+    def iteritems_flat(self, prefix=(), max_depth=None, min_depth=0):
+        """
+        Iterate through items with nested keys flattened into a tuple.
+
+        As for ``nested_dict.items_flat()``: only items below the sequence of keys prefix,
+        levels max_depth keys deep returned as (view) values, and values fewer than
+        min_depth keys deep skipped.
+        """
+        depth = len(self._prefix)
+        root = self._root
+        if prefix or max_depth is not None or min_depth:
+            return self._iter_limited_items(tuple(prefix), max_depth, min_depth)
+        if not depth:
+            return root._iter_prefix(())
+        return ((path[depth:], value) for path, value in root._iter_prefix(self._prefix))
+
+    def _iter_limited_items(self, prefix, max_depth, min_depth):
+        depth = len(self._prefix)
+        root = self._root
+        leaf_depth = root.levels - depth
+        if max_depth is None or max_depth > leaf_depth:
+            max_depth = leaf_depth
+        max_depth = max(max_depth, len(prefix))
+        if min_depth > max_depth:
+            return
+        full_prefix = self._prefix + prefix
+        if max_depth == leaf_depth:
+            for path, value in root._iter_prefix(full_prefix):
+                yield path[depth:], value
+            return
+        # one view per level max_depth keys deep
+        end = depth + max_depth
+        last = None
+        seen = set()
+        for path, value in root._iter_prefix(full_prefix):
+            level_path = path[:end]
+            if level_path != last and level_path not in seen:
+                last = level_path
+                seen.add(level_path)
+                yield level_path[depth:], root._view_type(root, level_path)
+
+    def iterkeys_flat(self, prefix=(), max_depth=None, min_depth=0):
+        """Iterate through keys with nested keys flattened into a tuple (see iteritems_flat)."""
+        for path, value in self.iteritems_flat(prefix, max_depth, min_depth):
+            yield path
+
+    def keys_at_level(self, level):
+        """Iterate through the key tuples at (0-based) level, i.e. level + 1 keys deep."""
+        return self.iterkeys_flat((), level + 1, level + 1)
+
+    def itervalues_flat(self):
+        """Iterate through values with nested keys flattened into a tuple."""
+        for path, value in self._root._iter_prefix(self._prefix):
+            yield value
+
+    items_flat = iteritems_flat
+    keys_flat = iterkeys_flat
+    values_flat = itervalues_flat
+
+    def to_dict(self):
+        """Convert to a nested series of standard ``dict`` objects."""
+        plain_dict = dict()
+        for path, value in self.iteritems_flat():
+            node = plain_dict
+            for key in path[:-1]:
+                child = node.get(key)
+                if child is None:
+                    child = node[key] = dict()
+                node = child
+            node[path[-1]] = value
+        return plain_dict
+
+    def __str__(self, indent=None):
+        """Representation of self as a string."""
+        import json
+        return json.dumps(self.to_dict(), indent=indent)
+
+    #
+    #   Storage primitives with a default in terms of _iter_prefix: scan the leaves
+    #
+    def _iter_keys(self, prefix):
+        depth = len(prefix)
+        seen = set()
+        for path, value in self._iter_prefix(prefix):
+            key = path[depth]
+            if key not in seen:
+                seen.add(key)
+                yield key
+
+    def _len_keys(self, prefix):
+        depth = len(prefix)
+        return len(set(path[depth] for path, value in self._iter_prefix(prefix)))
+
+
+class flat_nested_dict(_flat_view):
+    """
+    Nested dict with a fixed number of levels, stored flat.
+
+    All leaves live in a single ``dict`` keyed by the full tuple of keys, so there is
+    no per-level hash table. Intermediate levels are `_flat_view` objects created on
+    access. Unlike ``nested_dict``, merely reading a missing intermediate level does
+    not create anything.
+
+    The number of keys of each intermediate level is kept in ``_counts``, keyed by its
+    tuple of keys, so that ``in``, ``len`` and ``get`` on levels take constant time.
+    Iterating over an intermediate level, and ``items_flat()``, ``to_dict()`` or ``del``
+    of an intermediate level, still scan all the leaves.
+    """
+
+    __slots__ = ('levels', 'leaf_type', '_data', '_counts')
+
+    # class of the views returned for intermediate levels
+    _view_type = _flat_view
+
+    def __init__(self, levels, leaf_type=None):
+        """
+        Create an empty dictionary with a fixed number of levels.
+
+        :param levels: the (fixed) number of nested levels
+        :param leaf_type: optional factory for missing leaves, as for ``nested_dict(levels, type)``
+        """
+        if not isinstance(levels, int) or levels < 1:
+            raise Exception("flat_nested_dict should be initialised with the number of nested "
+                            "levels and an optional type (levels = %r)" % (levels,))
+        _flat_view.__init__(self, self, ())
+        self.levels = levels
+        self.leaf_type = leaf_type
+        self._data = dict()
+        # {prefix: number of keys in the level at prefix} for the top and intermediate levels
+        self._counts = dict()
+
+    #
+    #   Storage primitives: all access to the leaves goes through these
+    #
+    def _get(self, path, default):
+        return self._data.get(path, default)
+
+    def _get_leaf(self, path):
+        data = self._data
+        value = data.get(path, _missing)
+        if value is _missing:
+            if self.leaf_type is None:
+                raise KeyError(path[-1])
+            value = data[path] = self.leaf_type()
+            self._count(path, 1)
+        return value
+
+    def _set(self, path, value):
+        data = self._data
+        if path not in data:
+            self._count(path, 1)
+        data[path] = value
+
+    def _del(self, path):
+        try:
+            del self._data[path]
+        except KeyError:
+            raise KeyError(path[-1])
+        self._count(path, -1)
+
+    def _count(self, path, change):
+        """Count leaf path in (change=1), or out of (change=-1), the keys of the levels above it."""
+        counts = self._counts
+        # the count of a level just created, or emptied: only then does the level above it
+        # gain or lose a key
+        boundary = 1 if change > 0 else 0
+        depth = len(path)
+        while depth:
+            depth -= 1
+            prefix = path[:depth]
+            count = counts.get(prefix, 0) + change
+            if count:
+                counts[prefix] = count
+            else:
+                del counts[prefix]
+            if count != boundary:
+                return
+
+    def _iter_prefix(self, prefix):
+        if not prefix:
+            return iteritems(self._data)
+        if not self._has_prefix(prefix):
+            return iter(())
+        depth = len(prefix)
+        return ((path, value) for path, value in iteritems(self._data)
+                if path[:depth] == prefix)
+
+    def _has_prefix(self, prefix):
+        if not prefix:
+            return bool(self._data)
+        if len(prefix) >= self.levels:
+            return prefix in self._data
+        return prefix in self._counts
+
+    def _len_keys(self, prefix):
+        return self._counts.get(prefix, 0)
+
+    def _del_prefix(self, prefix):
+        if not prefix:
+            found = bool(self._data)
+            self._data.clear()
+            self._counts.clear()
+            return found
+        doomed = [path for path, value in self._iter_prefix(prefix)]
+        for path in doomed:
+            self._del(path)
+        return bool(doomed)
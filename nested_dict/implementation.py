@@ -30,81 +30,373 @@ from __future__ import division
 #################################################################################
 
 
+from binascii import hexlify
 from collections import defaultdict
 
+import hashlib
+import numbers
+import operator
 import sys
+import weakref
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+
+if sys.hexversion < 0x03000000:
+    def _iter_items(dictionary):
+        return dictionary.iteritems()
+
+    def _iter_values(dictionary):
+        return dictionary.itervalues()
+else:
+    def _iter_items(dictionary):
+        return iter(dictionary.items())
+
+    def _iter_values(dictionary):
+        return iter(dictionary.values())
+
+
+#
+#   Whether values of a given class are nested dictionaries (i.e. have keys()).
+#   Cached per class so that flattening does not probe every value with hasattr
+#
+_nested_types = {}
+
+
+def _is_nested_type(cls):
+    is_nested = _nested_types[cls] = hasattr(cls, "keys")
+    return is_nested
 
 
 def flatten_nested_items(dictionary):
     """
     Flatten a nested_dict.
 
-    iterate through nested dictionary (with iterkeys() method)
+    iterate through nested dictionary (with keys() method)
          and return with nested keys flattened into a tuple
+
+    Uses an explicit stack rather than recursion, so the depth of nesting is not
+        limited by the recursion limit, and each key tuple is built once per value.
+    """
+    return _flatten_items(dictionary, _iter_items)
+
+
+def _list_items(dictionary):
+    """Iterate through a copy of the items of dictionary, so that it can change meanwhile."""
+    return iter(list(_iter_items(dictionary)))
+
+
+def _flatten_items(dictionary, iter_items):
+    """flatten_nested_items(), with the items of each level from iter_items(level)."""
+    nested_types = _nested_types
+    stack = [((), iter_items(dictionary))]
+    while stack:
+        prefix, items = stack[-1]
+        for key, value in items:
+            is_nested = nested_types.get(value.__class__)
+            if is_nested is None:
+                is_nested = _is_nested_type(value.__class__)
+            if is_nested:
+                stack.append((prefix + (key,), iter_items(value)))
+                break
+            yield prefix + (key,), value
+        else:
+            stack.pop()
+
+
+def flatten_nested_values(dictionary):
+    """
+    Iterate through the values of a nested_dict without considering the degree of nesting.
+
+    Like flatten_nested_items() but never builds key tuples.
     """
+    nested_types = _nested_types
+    stack = [_iter_values(dictionary)]
+    while stack:
+        for value in stack[-1]:
+            is_nested = nested_types.get(value.__class__)
+            if is_nested is None:
+                is_nested = _is_nested_type(value.__class__)
+            if is_nested:
+                stack.append(_iter_values(value))
+                break
+            yield value
+        else:
+            stack.pop()
+
+
+def _flatten_limited_items(node, prefix, min_depth, max_depth):
+    """
+    Flatten the nested dictionary node, found at the sequence of keys prefix.
+
+    As flatten_nested_items() but with prefix at the start of each key tuple, nested levels
+    max_depth keys deep yielded as values rather than descended into, and values less than
+    min_depth keys deep skipped. Levels between prefix and max_depth are only descended into
+    if nested (i.e. siblings of prefix are never visited).
+    """
+    depth = len(prefix)
+    if max_depth is None:
+        max_depth = sys.maxsize
+    if depth >= max_depth or not _is_nested_type(node.__class__):
+        if depth >= min_depth:
+            yield prefix, node
+        return
+    nested_types = _nested_types
+    stack = [(prefix, depth + 1, _iter_items(node))]
+    while stack:
+        prefix, depth, items = stack[-1]
+        for key, value in items:
+            if depth < max_depth:
+                is_nested = nested_types.get(value.__class__)
+                if is_nested is None:
+                    is_nested = _is_nested_type(value.__class__)
+                if is_nested:
+                    stack.append((prefix + (key,), depth + 1, _iter_items(value)))
+                    break
+            if depth >= min_depth:
+                yield prefix + (key,), value
+        else:
+            stack.pop()
+
+
+def _json_key(key, _floatstr=float.__repr__, _intstr=int.__repr__):
+    """Convert a dictionary key to a string as the json module does."""
+    if isinstance(key, str):
+        return key
+    if isinstance(key, float):
+        if key != key:
+            return 'NaN'
+        if key == float('inf'):
+            return 'Infinity'
+        if key == -float('inf'):
+            return '-Infinity'
+        return _floatstr(key)
+    if key is True:
+        return 'true'
+    if key is False:
+        return 'false'
+    if key is None:
+        return 'null'
+    if isinstance(key, int):
+        return _intstr(key)
     if sys.hexversion < 0x03000000:
-        keys = dictionary.iterkeys
-        keystr = "iterkeys"
+        if isinstance(key, unicode):    # noqa: F821
+            return key
+        if isinstance(key, long):       # noqa: F821
+            # as str(), without the 'L' of repr()
+            return str(key)
+    raise TypeError("keys must be str, int, float, bool or None, not %s"
+                    % key.__class__.__name__)
+
+
+def iter_json_chunks(dictionary, indent=None, chunk_size=65536):
+    """
+    Encode a nested dictionary as JSON, identical to ``json.dumps(dictionary, indent=indent)``.
+
+    Walks the dictionary with an explicit stack and yields the encoded text in chunks
+    of about chunk_size characters, so memory use does not grow with its size.
+    """
+    return _iter_json_chunks(dictionary, indent, chunk_size, _iter_items)
+
+
+def _iter_json_chunks(dictionary, indent, chunk_size, iter_items):
+    """iter_json_chunks(), with the items of each level from iter_items(level)."""
+    import json
+    from json.encoder import encode_basestring_ascii
+
+    value_encoder = json.JSONEncoder(indent=indent)
+    # the separators json.dumps uses by default, which differ between python versions
+    item_separator = value_encoder.item_separator
+    key_separator = value_encoder.key_separator
+    int_repr = int.__repr__
+    if indent is None:
+        newline = None
     else:
-        keys = dictionary.keys
-        keystr = "keys"
-    for key in keys():
-        value = dictionary[key]
-        if hasattr(value, keystr):
-            for keykey, value in flatten_nested_items(value):
-                yield (key,) + keykey, value
+        if not isinstance(indent, str):
+            indent = ' ' * indent
+        newline = '\n'
+
+    if not len(dictionary):
+        yield '{}'
+        return
+
+    chunk = ['{']
+    chunk_len = 1
+    stack = [iter_items(dictionary)]
+    first = True
+    while stack:
+        for key, value in stack[-1]:
+            if newline is None:
+                separator = '' if first else item_separator
+            else:
+                separator = ('' if first else item_separator) + newline + indent * len(stack)
+            first = False
+            piece = separator + encode_basestring_ascii(_json_key(key)) + key_separator
+            descend = False
+            if isinstance(value, (dict, nested_dict_snapshot)):
+                if len(value):
+                    piece += '{'
+                    descend = True
+                else:
+                    piece += '{}'
+            elif value.__class__ is int:
+                piece += int_repr(value)
+            elif value.__class__ is str:
+                piece += encode_basestring_ascii(value)
+            else:
+                encoded = value_encoder.encode(value)
+                if newline is not None and newline in encoded:
+                    encoded = encoded.replace(newline, newline + indent * len(stack))
+                piece += encoded
+            chunk.append(piece)
+            chunk_len += len(piece)
+            if chunk_len >= chunk_size:
+                yield ''.join(chunk)
+                chunk = []
+                chunk_len = 0
+            if descend:
+                stack.append(iter_items(value))
+                first = True
+                break
         else:
-            yield (key,), value
+            stack.pop()
+            chunk.append('}' if newline is None else newline + indent * len(stack) + '}')
+            chunk_len += len(chunk[-1])
+            first = False
+    yield ''.join(chunk)
+
+
+_missing = object()
 
 
-class _recursive_dict(defaultdict):
+def _unchanging(nd):
+    """Return nd if it cannot change (i.e. frozen), else a snapshot() of it."""
+    snapshot = getattr(nd, "snapshot", None)
+    return nd if snapshot is None else snapshot()
+
+
+class _path_accessor(object):
     """
-    Parent class of nested_dict.
+    Index a nested dictionary with a tuple of keys.
 
-    Defined separately for _nested_levels to work
-    transparently, so dictionaries with a specified (and constant) degree of nestedness
-    can be created easily.
+    ``nd.path[a, b, c]`` is equivalent to ``nd.get_path((a, b, c))`` except that a missing
+    path raises ``KeyError``. Assignment, deletion and ``in`` map to ``set_path``,
+    ``del_path`` and ``has_path``. (Indexing the dictionary itself with a tuple still
+    uses the tuple as a single key.)
+    """
+
+    __slots__ = ('_nd',)
+
+    def __init__(self, nd):
+        self._nd = nd
+
+    def __getitem__(self, path):
+        if not isinstance(path, tuple):
+            path = (path,)
+        value = self._nd.get_path(path, _missing)
+        if value is _missing:
+            raise KeyError(path)
+        return value
+
+    def __setitem__(self, path, value):
+        if not isinstance(path, tuple):
+            path = (path,)
+        self._nd.set_path(path, value)
+
+    def __delitem__(self, path):
+        if not isinstance(path, tuple):
+            path = (path,)
+        self._nd.del_path(path)
+
+    def __contains__(self, path):
+        if not isinstance(path, tuple):
+            path = (path,)
+        return self._nd.has_path(path)
+
+
+class _nested_mapping(object):
+    """
+    Read-only methods shared by _recursive_dict and _frozen_nested_dict.
 
     The "_flat" functions are defined here rather than in nested_dict because they work
         recursively.
-
     """
 
-    def iteritems_flat(self):
-        """Iterate through items with nested keys flattened into a tuple."""
-        for key, value in flatten_nested_items(self):
-            yield key, value
+    __slots__ = ()
 
-    def iterkeys_flat(self):
-        """Iterate through keys with nested keys flattened into a tuple."""
-        for key, value in flatten_nested_items(self):
-            yield key
+    def iteritems_flat(self, prefix=(), max_depth=None, min_depth=0):
+        """
+        Iterate through items with nested keys flattened into a tuple.
+
+        Only items below the sequence of keys prefix are visited (none if it is missing):
+        their key tuples start with prefix. Nested levels max_depth keys deep are
+        returned as values, without descending into them, and values fewer than
+        min_depth keys deep are skipped.
+        """
+        if not prefix and max_depth is None and not min_depth:
+            return flatten_nested_items(self)
+        prefix = tuple(prefix)
+        node = self.get_path(prefix, _missing)
+        if node is _missing:
+            return iter(())
+        return _flatten_limited_items(node, prefix, min_depth, max_depth)
+
+    def iterkeys_flat(self, prefix=(), max_depth=None, min_depth=0):
+        """Iterate through keys with nested keys flattened into a tuple (see iteritems_flat)."""
+        return (key for key, value in self.iteritems_flat(prefix, max_depth, min_depth))
+
+    def keys_at_level(self, level):
+        """
+        Iterate through the key tuples of the items at (0-based) level, i.e. level + 1 keys deep.
+
+        Does not descend below level.
+        """
+        return self.iterkeys_flat((), level + 1, level + 1)
 
     def itervalues_flat(self):
         """Iterate through values with nested keys flattened into a tuple."""
-        for key, value in flatten_nested_items(self):
-            yield value
+        return flatten_nested_values(self)
 
     items_flat = iteritems_flat
     keys_flat = iterkeys_flat
     values_flat = itervalues_flat
 
-    def to_dict(self, input_dict=None):
-        """Convert the nested dictionary to a nested series of standard ``dict`` objects."""
-        #
-        # Calls itself recursively to unwind the dictionary.
-        # Use to_dict() to start at the top level of nesting
-        plain_dict = dict()
+    def to_dict(self, input_dict=None, copy=True):
+        """
+        Convert the nested dictionary to a nested series of standard ``dict`` objects.
+
+        If copy is False, no copy is made: instead, the default factories of the nested
+        dictionary are removed in place, so that it behaves like nested standard ``dict``
+        objects (missing keys raise ``KeyError``), and it is returned.
+        """
         if input_dict is None:
             input_dict = self
-        for key in input_dict.keys():
-            value = input_dict[key]
-            if isinstance(value, _recursive_dict):
-                # print "recurse", value
-                plain_dict[key] = self.to_dict(value)
-            else:
-                # print "plain", value
-                plain_dict[key] = value
+        if not copy:
+            stack = [input_dict]
+            while stack:
+                nested = stack.pop()
+                if isinstance(nested, defaultdict):
+                    nested.default_factory = None
+                for value in itervalues(nested):
+                    if isinstance(value, _nested_mapping):
+                        stack.append(value)
+            return input_dict
+
+        plain_dict = dict()
+        nested_stack = [input_dict]
+        plain_stack = [plain_dict]
+        while nested_stack:
+            plain = plain_stack.pop()
+            for key, value in iteritems(nested_stack.pop()):
+                if isinstance(value, _nested_mapping):
+                    plain[key] = plain_value = dict()
+                    nested_stack.append(value)
+                    plain_stack.append(plain_value)
+                else:
+                    plain[key] = value
         return plain_dict
 
     def __str__(self, indent=None):
@@ -112,27 +404,645 @@ class _recursive_dict(defaultdict):
         import json
         return json.dumps(self.to_dict(), indent=indent)
 
+    def dump_json(self, fp, indent=None, chunk_size=65536):
+        """
+        Write as JSON to the file-like object fp, without converting to_dict() first.
+
+        The output is identical to ``json.dump(self.to_dict(), fp, indent=indent)`` but
+        is written in chunks of about chunk_size characters.
+        """
+        for chunk in iter_json_chunks(self, indent, chunk_size):
+            fp.write(chunk)
+
+    #
+    #   For asyncio event loops (Python 3.6+): give control back to the loop periodically
+    #
+    def aitems_flat(self, yield_every=1000, consistent=False):
+        """
+        Asynchronously iterate through items with nested keys flattened into a tuple.
+
+        Control is given back to the event loop after every yield_every items, so other
+        tasks can write meanwhile. The items of each level are copied when it is reached,
+        so writes to levels not reached yet are seen. If consistent is True, the items are
+        instead those of a ``snapshot()`` taken when called.
+        """
+        from ._async import aiter_batches
+        if consistent:
+            return aiter_batches(flatten_nested_items(_unchanging(self)), yield_every)
+        return aiter_batches(_flatten_items(self, _list_items), yield_every)
+
+    def akeys_flat(self, yield_every=1000, consistent=False):
+        """
+        Asynchronously iterate through keys with nested keys flattened into a tuple.
+
+        Control is given back to the event loop after every yield_every keys. consistent is
+        as for aitems_flat().
+        """
+        from ._async import aiter_batches
+        if consistent:
+            return aiter_batches(_unchanging(self).iterkeys_flat(), yield_every)
+        return aiter_batches((path for path, value in _flatten_items(self, _list_items)),
+                             yield_every)
+
+    def adump_json(self, writer, indent=None, chunk_size=16384, consistent=False):
+        """
+        Coroutine writing JSON (as for dump_json()) to writer, e.g. an ``asyncio.StreamWriter``.
+
+        The UTF-8 encoded text is written in chunks of about chunk_size characters, and
+        ``writer.drain()`` awaited after each, giving control back to the event loop.
+        consistent is as for aitems_flat().
+        """
+        from ._async import awrite_chunks
+        if consistent:
+            chunks = iter_json_chunks(_unchanging(self), indent, chunk_size)
+        else:
+            chunks = _iter_json_chunks(self, indent, chunk_size, _list_items)
+        return awrite_chunks(chunks, writer)
+
+    #
+    #   Access by a sequence of keys ("path") in a single loop over the levels.
+    #   Reads use dict.get so never fall into __missing__ and never create levels.
+    #
+    @property
+    def path(self):
+        """Accessor so that ``nd.path[a, b, c]`` indexes with a tuple of keys."""
+        return _path_accessor(self)
+
+    def get_path(self, path, default=None):
+        """Return the value for the sequence of keys in `path`, or default, creating no levels."""
+        dict_get = dict.get
+        node = self
+        try:
+            for key in path:
+                node = dict_get(node, key, _missing)
+        except TypeError:
+            # stepped past a missing key or a value which is not a dictionary
+            return default
+        if node is _missing:
+            return default
+        return node
+
+    def has_path(self, path):
+        """Return whether the sequence of keys in `path` is present, without creating levels."""
+        return self.get_path(path, _missing) is not _missing
+
+    def len_flat(self):
+        """
+        Return the number of values (not nested levels) at all levels.
+
+        Kept up to date after ``count_sizes()``; otherwise counted by walking all levels.
+        """
+        sizes = getattr(self, "_sizes", None)
+        if sizes is None:
+            sizes = _count_sizes(self)
+        return sizes[0]
+
+    def level_sizes(self):
+        """
+        Return a list of the number of keys (values or nested levels) at each (0-based) level.
+
+        Kept up to date after ``count_sizes()``; otherwise counted by walking all levels.
+        """
+        sizes = getattr(self, "_sizes", None)
+        if sizes is None:
+            sizes = _count_sizes(self)
+        sizes = sizes[1:]
+        while sizes and not sizes[-1]:
+            sizes.pop()
+        return sizes
+
+    def aggregate(self, prefix=(), how='sum'):
+        """
+        Return the 'sum', 'count', 'min' or 'max' of the values below the sequence of keys prefix.
+
+        Never creates levels. Raises KeyError if prefix is missing, and ValueError for the
+        'min' or 'max' of no values. After ``cache_aggregates()``, results are cached in
+        each nested level until it changes.
+        """
+        nd = self.get_path(prefix, _missing)
+        if nd is _missing:
+            raise KeyError(tuple(prefix))
+        if _is_nested_type(nd.__class__):
+            result = _aggregate(nd, how)
+        else:
+            result = _aggregate({None: nd}, how)
+        if result is _missing:
+            raise ValueError("aggregate() of no values (%r)" % (how,))
+        return result
+
+    def digest(self, prefix=()):
+        """
+        Return a hash (as bytes) of the contents below the sequence of keys prefix.
+
+        Equal nested dictionaries have equal digests, in any process, if their keys and
+        values are numbers, strings, None, or tuples, lists or sets of these (see
+        _digest_text). Never creates levels. Raises KeyError if prefix is missing. After
+        ``cache_digests()``, digests are cached in each nested level until it changes.
+        """
+        nd = self.get_path(prefix, _missing)
+        if nd is _missing:
+            raise KeyError(tuple(prefix))
+        if _is_nested_type(nd.__class__):
+            return _level_digest(nd)
+        return hashlib.sha1(_utf8('v' + _digest_text(nd))).digest()
+
+    def digest_equal(self, other, prefix=()):
+        """
+        Return whether the digests of this and another nested dictionary below prefix are equal.
+
+        With ``cache_digests()`` on both, only levels changed since their digests were last
+        taken are hashed again. Unlike ``==``, values are compared by their encoding (see
+        digest()), and leaf values changed in place are not seen.
+        """
+        return self.digest(prefix) == other.digest(prefix)
+
+    def freeze(self):
+        """
+        Return an immutable, hashable snapshot of the nested dictionary.
+
+        Missing keys raise ``KeyError`` rather than creating new levels.
+        """
+        stack = [(_iter_items(self), [], None)]
+        while True:
+            items, frozen_items, parent_key = stack[-1]
+            for key, value in items:
+                is_nested = _nested_types.get(value.__class__)
+                if is_nested is None:
+                    is_nested = _is_nested_type(value.__class__)
+                if is_nested:
+                    stack.append((_iter_items(value), [], key))
+                    break
+                frozen_items.append((key, value))
+            else:
+                stack.pop()
+                frozen = _frozen_nested_dict(frozen_items)
+                if not stack:
+                    return frozen
+                stack[-1][1].append((parent_key, frozen))
+
+    def diff(self, other):
+        """
+        Return the changes which turn this nested dictionary into other, for ``apply_patch()``.
+
+        A list of ``('add', path, value)``, ``('change', path, value)`` and
+        ``('remove', path)`` tuples, where nested values are plain ``dict`` copies.
+        Nested levels which are the same object, or compare equal, are not descended into.
+        """
+        return _diff(self, other)
+
+
+class _recursive_dict(_nested_mapping, defaultdict):
+    """
+    Parent class of nested_dict.
+
+    Defined separately for _nested_levels to work
+    transparently, so dictionaries with a specified (and constant) degree of nestedness
+    can be created easily.
+    """
+
+    def set_path(self, path, value):
+        """Set the value for the sequence of keys in `path`, creating missing levels."""
+        dict_get = dict.get
+        node = self
+        for key in path[:-1]:
+            child = dict_get(node, key, _missing)
+            if child is _missing:
+                child = _add_level(node, key)
+            node = child
+        node[path[-1]] = value
+
+    def setdefault_path(self, path, default=None):
+        """Return the value for `path` if present, else set it to default and return default."""
+        dict_get = dict.get
+        node = self
+        for key in path[:-1]:
+            child = dict_get(node, key, _missing)
+            if child is _missing:
+                child = _add_level(node, key)
+            node = child
+        return node.setdefault(path[-1], default)
+
+    def del_path(self, path):
+        """Delete the value for the sequence of keys in `path`. Raise KeyError if missing."""
+        node = self.get_path(path[:-1], _missing)
+        if not isinstance(node, dict):
+            # as for get_path(), only nested levels are stepped into
+            raise KeyError(path)
+        try:
+            del node[path[-1]]
+        except (KeyError, TypeError, IndexError):
+            raise KeyError(path)
+
+    def update_flat(self, iterable):
+        """
+        Update from (key tuple, value) pairs, as produced by ``items_flat()``.
+
+        Missing levels are created by calling the level factories directly rather than
+        through ``__missing__``. Consecutive pairs with the same parent keys (e.g. sorted
+        input) reuse the last parent dictionary without any lookups.
+        """
+        dict_get = dict.get
+        last_parent_keys = None
+        parent = None
+        for path, value in iterable:
+            parent_keys = path[:-1]
+            if parent_keys != last_parent_keys:
+                parent = self
+                for key in parent_keys:
+                    child = dict_get(parent, key, _missing)
+                    if child is _missing:
+                        child = _new_level(parent)
+                        parent[key] = child
+                    parent = child
+                last_parent_keys = parent_keys
+            parent[path[-1]] = value
+
+    def apply_patch(self, patch):
+        """
+        Apply the changes returned by ``diff()``, in order, creating missing levels.
+
+        Paths may be lists (e.g. after a round trip through JSON). Raises KeyError if a
+        path to be removed is missing.
+        """
+        for change in patch:
+            operation, path = change[0], tuple(change[1])
+            if operation == 'remove':
+                self.del_path(path)
+            elif operation in ('add', 'change'):
+                value = change[2]
+                parent = self
+                for key in path[:-1]:
+                    parent = parent[key]
+                if isinstance(value, dict):
+                    # replace rather than merge with any level already there
+                    parent.pop(path[-1], None)
+                    _recursive_update(parent, {path[-1]: value})
+                else:
+                    parent[path[-1]] = value
+            else:
+                raise ValueError("Unknown patch operation %r" % (operation,))
+
+    def save(self, filename):
+        """
+        Write to filename as a compact binary snapshot, to be read by ``nested_dict.open()``.
+
+        Each top level key's value is written separately, with the keys nested below it
+        replaced by their numbers in a single table of keys.
+        """
+        from .binary import save_binary
+        save_binary(self, filename)
+
+    def cache_aggregates(self, enable=True):
+        """
+        Cache the results of aggregate() in each nested level (or stop, if enable is False).
+
+        Every write then goes through Python code which invalidates the cached aggregates of
+        the level written to and of the levels above it, so that aggregate() only has to
+        recompute levels which have changed. Writes become several times slower.
+        """
+        if enable:
+            _track(self, getattr(self, "_parent", None), getattr(self, "_key", None))
+            self._caching_aggregates = True
+        elif isinstance(self, _tracked_nested_dict):
+            self._caching_aggregates = False
+            stack = [self]
+            while stack:
+                nd = stack.pop()
+                if isinstance(nd, _tracked_nested_dict):
+                    nd._aggregates = None
+                    stack.extend(_iter_values(nd))
+            _stop_tracking(self)
+
+    def cache_digests(self, enable=True):
+        """
+        Cache the results of digest() in each nested level (or stop, if enable is False).
+
+        As for ``cache_aggregates()``, writes invalidate the cached digests of the level
+        written to and of the levels above it, so that digest() and digest_equal() only
+        have to rehash levels which have changed. Leaf values changed in place are not seen.
+        """
+        if enable:
+            _track(self, getattr(self, "_parent", None), getattr(self, "_key", None))
+            self._caching_digests = True
+        elif isinstance(self, _tracked_nested_dict):
+            self._caching_digests = False
+            stack = [self]
+            while stack:
+                nd = stack.pop()
+                if isinstance(nd, _tracked_nested_dict):
+                    nd._digest = None
+                    stack.extend(_iter_values(nd))
+            _stop_tracking(self)
+
+    def count_sizes(self, enable=True):
+        """
+        Keep count of the values and the keys at each level (or stop, if enable is False).
+
+        len_flat() and level_sizes() then take constant time rather than walking all levels.
+        Every write goes through Python code which updates the counts, so writes become
+        slower.
+        """
+        if enable:
+            _track(self, getattr(self, "_parent", None), getattr(self, "_key", None))
+            self._sizes = _count_sizes(self)
+        elif isinstance(self, _tracked_nested_dict):
+            self._sizes = None
+            _stop_tracking(self)
+
+    def snapshot(self):
+        """
+        Return a read-only view of the nested dictionary as it is now.
+
+        Later writes copy the nested levels written to (once per snapshot), rather than the
+        snapshot copying the whole dictionary. The first snapshot switches the levels to
+        tracked levels, whose writes are slower, and they stay tracked.
+        """
+        clock = getattr(self, "_snapshots", None)
+        if clock is None:
+            _track(self, getattr(self, "_parent", None), getattr(self, "_key", None))
+            clock = self._snapshots = _snapshot_epochs()
+            _version(self)
+        return nested_dict_snapshot(self, clock.new_epoch())
+
+    def create_index(self, level):
+        """
+        Index the keys at (0-based) level of nesting, so that lookup(level, key) need not search.
+
+        The index maps each key to the set of paths to the levels holding it, and is kept up
+        to date through writes to the nested levels (which become slower).
+        """
+        _track(self, getattr(self, "_parent", None), getattr(self, "_key", None))
+        index = dict()
+        _index_keys(index, level, (), self)
+        if self._indexes is None:
+            self._indexes = dict()
+        self._indexes[level] = index
+
+    def drop_index(self, level):
+        """Remove the index created by create_index(level)."""
+        indexes = getattr(self, "_indexes", None)
+        if not indexes or level not in indexes:
+            raise KeyError(level)
+        del indexes[level]
+        _stop_tracking(self)
+
+    def lookup(self, level, key, items=False):
+        """
+        Return the paths (tuples of keys) of all the values or levels with key at (0-based) level.
+
+        If items is True, return (path, value) pairs instead. Uses the index from
+        create_index(level) if there is one; otherwise searches the levels down to level.
+        """
+        indexes = getattr(self, "_indexes", None)
+        index = indexes.get(level) if indexes else None
+        if index is not None:
+            paths = [parent_path + (key,) for parent_path in index.get(key, ())]
+        else:
+            paths = []
+            stack = [((), self)]
+            while stack:
+                path, nd = stack.pop()
+                if len(path) == level:
+                    if key in nd:
+                        paths.append(path + (key,))
+                    continue
+                for nested_key, value in _iter_items(nd):
+                    if _is_nested_type(value.__class__):
+                        stack.append((path + (nested_key,), value))
+        if items:
+            return [(path, self.get_path(path)) for path in paths]
+        return paths
+
+    def __reduce__(self):
+        """
+        Pickle as flat lists of keys and values.
+
+        Avoids the recursion of pickling each nested level in turn, and allows the nested
+        levels to be rebuilt in bulk using the level factories.
+        """
+        keys, flags, values = _flatten_tree(self)
+        cls, state = _untracked_class_and_state(self)
+        return (_unflatten_tree,
+                (cls, self.default_factory, state, len(self), keys, flags, values))
+
+
+class _frozen_nested_dict(_nested_mapping, dict):
+    """
+    Immutable snapshot of a nested_dict, returned by freeze().
+
+    A plain ``dict`` with no default factory (so missing keys raise ``KeyError``), no
+    per-instance ``__dict__``, and nested levels which are themselves frozen. As it
+    cannot change, it can be shared between threads without locks.
+
+    It is hashable if all the values are.
+    """
+
+    __slots__ = ('_hash',)
+
+    def _read_only(self, *args, **named_args):
+        raise TypeError("frozen nested_dict does not support modification")
+
+    __setitem__ = __delitem__ = _read_only
+    clear = pop = popitem = setdefault = update = __ior__ = _read_only
+    set_path = setdefault_path = del_path = update_flat = _read_only
+
+    def __hash__(self):
+        try:
+            return self._hash
+        except AttributeError:
+            self._hash = hash(frozenset(_iter_items(self)))
+            return self._hash
+
+    def __reduce__(self):
+        return (self.__class__, (dict(self),))
+
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__, dict.__repr__(self))
+
+    def freeze(self):
+        """Return self: already frozen."""
+        return self
+
+
+def _new_level(parent):
+    """Create a new nested level for parent, as parent.__missing__ would."""
+    factory = getattr(parent, "default_factory", None)
+    if factory is not None:
+        child = factory()
+        if isinstance(child, dict):
+            return child
+    # Deeper than the fixed levels of nesting: values here must have been plain dicts
+    return nested_dict()
+
+
+def _add_level(parent, key):
+    """
+    Put a new nested level for the missing key in parent and return it.
+
+    As for ``parent[key]``, but bypassing ``__missing__`` and the level factories of
+    _nested_levels. The level is put in with ``setdefault``, so that concurrent levels
+    keep whichever level got there first.
+    """
+    if getattr(parent, "default_factory", None) is None:
+        raise KeyError(key)
+    return parent.setdefault(key, _new_level(parent))
+
+
+def _plain_value(value):
+    """Copy nested levels (of any kind) in value to plain dicts for a patch."""
+    if not _is_nested_type(value.__class__):
+        return value
+    to_dict = getattr(value, "to_dict", None)
+    return to_dict() if to_dict is not None else dict(value)
+
+
+def _same_levels(mine, other):
+    """Whether two nested levels are equal, without descending into them from python."""
+    if mine is other:
+        return True
+    # frozen levels which have already been hashed can only be equal if the hashes are
+    if mine.__class__ is _frozen_nested_dict and other.__class__ is _frozen_nested_dict:
+        mine_hash = getattr(mine, "_hash", None)
+        other_hash = getattr(other, "_hash", None)
+        if mine_hash is not None and other_hash is not None and mine_hash != other_hash:
+            return False
+    # compared by dict at C speed: only levels which differ are walked key by key
+    return mine == other
+
+
+def _diff(mine, other):
+    """
+    List the changes from mine to other (see ``diff()``).
+
+    Walks only the nested levels which differ, with an explicit stack.
+    """
+    nested_types = _nested_types
+    patch = []
+    stack = [((), mine, other)]
+    while stack:
+        prefix, mine, other = stack.pop()
+        for key, value in _iter_items(mine):
+            other_value = other.get(key, _missing)
+            if other_value is value:
+                continue
+            if other_value is _missing:
+                patch.append(('remove', prefix + (key,)))
+                continue
+            is_nested = nested_types.get(value.__class__)
+            if is_nested is None:
+                is_nested = _is_nested_type(value.__class__)
+            other_is_nested = nested_types.get(other_value.__class__)
+            if other_is_nested is None:
+                other_is_nested = _is_nested_type(other_value.__class__)
+            if is_nested and other_is_nested:
+                if not _same_levels(value, other_value):
+                    stack.append((prefix + (key,), value, other_value))
+            elif is_nested or other_is_nested or value != other_value:
+                patch.append(('change', prefix + (key,), _plain_value(other_value)))
+        for key, other_value in _iter_items(other):
+            if key not in mine:
+                patch.append(('add', prefix + (key,), _plain_value(other_value)))
+    return patch
+
+
+def _flatten_tree(tree):
+    """
+    Flatten a nested dictionary into parallel keys, flags and values, in depth first order.
+
+    For nested levels, the flag is 1 and the value is the number of items in that level.
+    Otherwise the flag is 0 and the value is the value. Other mappings (e.g. plain dicts
+    or ``Counter``) are values, kept as they are, since they are not nested levels.
+    """
+    keys = []
+    flags = bytearray()
+    values = []
+    stack = [_iter_items(tree)]
+    while stack:
+        for key, value in stack[-1]:
+            keys.append(key)
+            if isinstance(value, _recursive_dict):
+                flags.append(1)
+                values.append(len(value))
+                stack.append(_iter_items(value))
+                break
+            flags.append(0)
+            values.append(value)
+        else:
+            stack.pop()
+    return keys, flags, values
+
+
+def _unflatten_tree(cls, default_factory, state, size, keys, flags, values):
+    """Rebuild a nested dictionary from _flatten_tree() output (used for unpickling)."""
+    tree = cls.__new__(cls)
+    defaultdict.__init__(tree, default_factory)
+    if state:
+        tree.__dict__.update(state)
+    stack = []
+    node = tree
+    remaining = size
+    for key, is_nested, value in zip(keys, flags, values):
+        while not remaining:
+            node, remaining = stack.pop()
+        remaining -= 1
+        if not is_nested:
+            node[key] = value
+            continue
+        child = _new_level(node)
+        node[key] = child
+        if value:
+            stack.append((node, remaining))
+            node = child
+            remaining = value
+    return tree
+
 
 class _any_type(object):
     pass
 
 
+class _nested_levels_factory(object):
+    """
+    Factory for the nested levels of a dictionary with a specified degree of nestedness.
+
+    A class rather than a lambda so that nested_dicts can be pickled.
+    """
+
+    __slots__ = ('level', 'nested_type', 'child_factory')
+
+    def __init__(self, level, nested_type):
+        self.level = level
+        self.nested_type = nested_type
+        self.child_factory = _nested_levels(level - 1, nested_type)
+
+    def __call__(self):
+        return _recursive_dict(self.child_factory)
+
+    def __reduce__(self):
+        return (self.__class__, (self.level, self.nested_type))
+
+    def __repr__(self):
+        return "%s(%r, %r)" % (self.__class__.__name__, self.level, self.nested_type)
+
+
 def _nested_levels(level, nested_type):
     """Helper function to create a specified degree of nested dictionaries."""
     if level > 2:
-        return lambda: _recursive_dict(_nested_levels(level - 1, nested_type))
+        return _nested_levels_factory(level, nested_type)
     if level == 2:
         if isinstance(nested_type, _any_type):
-            return lambda: _recursive_dict()
+            return _recursive_dict
         else:
-            return lambda: _recursive_dict(_nested_levels(level - 1, nested_type))
+            return _nested_levels_factory(level, nested_type)
     return nested_type
 
 
 if sys.hexversion < 0x03000000:
     iteritems = dict.iteritems
+    itervalues = dict.itervalues
 else:
     iteritems = dict.items
+    itervalues = dict.values
 
 
 # _________________________________________________________________________________________
@@ -142,12 +1052,19 @@ else:
 # _________________________________________________________________________________________
 def nested_dict_from_dict(orig_dict, nd):
     """Helper to build nested_dict from a dict."""
-    for key, value in iteritems(orig_dict):
-        if isinstance(value, (dict,)):
-            nd[key] = nested_dict_from_dict(value, nested_dict())
-        else:
-            nd[key] = value
-    return nd
+    return _update_from_dict(nd, orig_dict, False)
+
+
+def _new_nested_dict(cls, levels, leaf_type):
+    """Create an empty nested_dict of class cls with the given levels and leaf type."""
+    if levels is None:
+        if leaf_type is not None:
+            raise Exception("nested_dict can only have a leaf type with a fixed number of levels "
+                            "(leaf_type = %r)" % (leaf_type,))
+        return cls()
+    if leaf_type is None:
+        return cls(levels)
+    return cls(levels, leaf_type)
 
 
 def _recursive_update(nd, other):
@@ -176,6 +1093,1023 @@ def _recursive_update(nd, other):
     return nd
 
 
+def _plain_dicts_in_lists(nd):
+    """
+    Turn nested levels inside lists in nd (e.g. JSON objects in arrays) back into plain dicts.
+
+    Only nested levels reached through keys from nd are left as nested levels.
+    """
+    levels = [nd]
+    containers = []
+    while levels:
+        for value in _iter_values(levels.pop()):
+            if isinstance(value, _recursive_dict):
+                levels.append(value)
+            elif isinstance(value, list):
+                containers.append(value)
+    _plain_dicts_in(containers)
+
+
+def _plain_dicts_in(containers):
+    """Turn the nested levels inside the lists and dicts in containers, at any depth, into dicts."""
+    while containers:
+        container = containers.pop()
+        keys = range(len(container)) if isinstance(container, list) else list(container)
+        for key in keys:
+            value = container[key]
+            if isinstance(value, _recursive_dict):
+                container[key] = value = dict(value)
+            if isinstance(value, (list, dict)):
+                containers.append(value)
+
+
+def _level_factories(nd):
+    """
+    Return the default factories of the nested levels of nd, by depth.
+
+    The first is for the levels directly in nd. Stops at the level holding values,
+    so returns an empty list if nd itself holds values.
+    """
+    factories = []
+    factory = nd.default_factory
+    while factory is not None:
+        level = factory()
+        if not isinstance(level, _recursive_dict):
+            break
+        factory = level.default_factory
+        factories.append(factory)
+    return factories
+
+
+def _set_level_factories(nd):
+    """
+    Give the nested levels of nd the default factories nd's own factories would have.
+
+    For nested levels built without factories (e.g. while parsing JSON). Levels nested
+    deeper than nd allows are turned into plain dicts, as for ``from_dict()``.
+    """
+    factories = _level_factories(nd)
+    max_depth = len(factories)
+    innermost = []
+    stack = [(nd, 0)]
+    while stack:
+        level, depth = stack.pop()
+        if depth == max_depth:
+            innermost.append(level)
+            continue
+        factory = factories[depth]
+        for value in _iter_values(level):
+            if isinstance(value, _recursive_dict):
+                value.default_factory = factory
+                stack.append((value, depth + 1))
+    _plain_dicts_in(innermost)
+
+
+def _update_from_dict(nd, orig_dict, fixed_levels):
+    """
+    Copy a (nested) dict into an empty nested_dict, creating nested levels for nested dicts.
+
+    If fixed_levels, nested levels are created with the factories nd's own factories
+    would use, and the innermost levels are copied wholesale without examining each value.
+    Otherwise, nested dicts become nested_dict(), as for ``nested_dict(orig_dict)``.
+    """
+    factories = _level_factories(nd) if fixed_levels else None
+    max_depth = len(factories) if fixed_levels else -1
+    orig_stack = [orig_dict]
+    nd_stack = [nd]
+    depth_stack = [0]
+    while orig_stack:
+        orig = orig_stack.pop()
+        level = nd_stack.pop()
+        depth = depth_stack.pop()
+        if depth == max_depth:
+            dict.update(level, orig)
+            continue
+        factory = factories[depth] if fixed_levels else None
+        for key, value in iteritems(orig):
+            if isinstance(value, dict):
+                level[key] = nested = (_recursive_dict(factory) if fixed_levels else nested_dict())
+                orig_stack.append(value)
+                nd_stack.append(nested)
+                depth_stack.append(depth + 1)
+            else:
+                level[key] = value
+    return nd
+
+
+def _overwrite(mine, other):
+    return other
+
+
+def _extend(mine, other):
+    mine.extend(other)
+    return mine
+
+
+def _union(mine, other):
+    mine.update(other)
+    return mine
+
+
+#
+#   on_conflict strategies for merge(): name -> (combine function, modifies values in place)
+#
+_merge_strategies = {
+    'overwrite': (_overwrite, False),
+    'sum': (operator.add, False),
+    'max': (max, False),
+    'min': (min, False),
+    'extend': (_extend, True),
+    'union': (_union, True),
+}
+
+
+def _merge_strategy(on_conflict):
+    """Return (combine function, whether it modifies values in place) for on_conflict."""
+    if callable(on_conflict):
+        return on_conflict, False
+    try:
+        return _merge_strategies[on_conflict]
+    except (KeyError, TypeError):
+        raise ValueError("on_conflict should be one of %s or a function (not %r)"
+                         % (", ".join(sorted(_merge_strategies)), on_conflict))
+
+
+def _merge_into(nd, other, combine, steal=False, in_place=False):
+    """
+    Merge other into nd, combining values present in both with combine(mine, other's).
+
+    Uses an explicit stack, and dict.get so that no nested levels are created except
+    for keys only in other. Where one side has a nested level and the other a value,
+    other's wins, as for update().
+
+    Nested levels only in other are copied into new levels of nd, or if steal, put into nd
+    as they are. If in_place (combine modifies its first argument), values only in
+    other are copied when added to nd so that other is not changed by later merges.
+    """
+    import copy
+    dict_get = dict.get
+    nested_types = _nested_types
+    stack = [(nd, other)]
+    while stack:
+        nd, other = stack.pop()
+        for key, value in _iter_items(other):
+            is_nested = nested_types.get(value.__class__)
+            if is_nested is None:
+                is_nested = _is_nested_type(value.__class__)
+            mine = dict_get(nd, key, _missing)
+            if mine is _missing:
+                if not is_nested:
+                    nd[key] = copy.copy(value) if in_place and not steal else value
+                elif steal:
+                    nd[key] = value
+                else:
+                    mine = nd[key] = _new_level(nd)
+                    stack.append((mine, value))
+                continue
+            mine_is_nested = nested_types.get(mine.__class__)
+            if mine_is_nested is None:
+                mine_is_nested = _is_nested_type(mine.__class__)
+            if is_nested:
+                if not mine_is_nested:
+                    if steal:
+                        nd[key] = value
+                        continue
+                    mine = nd[key] = _new_level(nd)
+                stack.append((mine, value))
+            elif mine_is_nested:
+                nd[key] = value
+            else:
+                nd[key] = combine(mine, value)
+    return nd
+
+
+def _empty_like(nd):
+    """Return an empty nested dictionary with the same type, levels and type of values as nd."""
+    if not isinstance(nd, _recursive_dict):
+        return nested_dict()
+    cls, state = _untracked_class_and_state(nd)
+    return _unflatten_tree(cls, nd.default_factory, state, 0, (), (), ())
+
+
+def _merge_shard(param):
+    """Merge the dictionaries for one shard of top level keys (in a worker process)."""
+    template, dicts, combine = param
+    combine, in_place = _merge_strategy(combine)
+    for other in dicts:
+        _merge_into(template, other, combine, in_place=in_place)
+    return template
+
+
+# _________________________________________________________________________________________
+#
+#   Tracked nested levels: opt-in bookkeeping on every write
+#
+# _________________________________________________________________________________________
+class _tracked_nested_dict(object):
+    """
+    Mixin for nested levels which keep track of writes.
+
+    Writes are tracked to cache aggregates, index keys, count sizes and copy levels on
+    write for snapshots. Tracking is opt-in: the levels of an existing nested dictionary
+    are switched in place to a subclass of their own class with this mixin (see _track).
+    Each tracked level has a link to the level above it and its key there, and all writes
+    go through the Python methods below, which call _changed().
+
+    The level on which tracking was turned on holds the settings, e.g. the indexes.
+    """
+
+    __slots__ = ()
+
+    # per instance once set
+    _parent = None
+    _key = None
+    _aggregates = None
+    _caching_aggregates = False
+    _digest = None
+    _caching_digests = False
+    _indexes = None
+    # [number of values, number of keys at level 0, at level 1, ...]
+    _sizes = None
+    # the _snapshot_epochs of this level's snapshots, once snapshot() was called on it
+    _snapshots = None
+    # the _snapshot_epochs of the snapshots of levels this level was moved from
+    _former = None
+    # snapshot epoch when last copied (None if not in snapshots), and
+    # [(epoch, items, weak references to the snapshot tokens which read items)...]
+    _saved = None
+    _history = None
+
+    def __setitem__(self, key, value):
+        old = dict.get(self, key, _missing)
+        if isinstance(value, _recursive_dict):
+            _track(value, self, key)
+            if self._saved is not None and value._saved is None:
+                _version(value)
+        if self._saved is not None:
+            _copy_on_write(self)
+        dict.__setitem__(self, key, value)
+        if old is not value:
+            _detach(self, old)
+        _changed(self, key, old, value)
+
+    def __delitem__(self, key):
+        if self._saved is not None:
+            _copy_on_write(self)
+        old = dict.pop(self, key, _missing)
+        if old is _missing:
+            raise KeyError(key)
+        _detach(self, old)
+        _changed(self, key, old, _missing)
+
+    def pop(self, key, *default):
+        """Remove key and return its value, as for ``dict.pop``."""
+        if self._saved is not None:
+            _copy_on_write(self)
+        old = dict.pop(self, key, _missing)
+        if old is _missing:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        _detach(self, old)
+        _changed(self, key, old, _missing)
+        return old
+
+    def popitem(self):
+        """Remove and return a (key, value) pair, as for ``dict.popitem``."""
+        if self._saved is not None:
+            _copy_on_write(self)
+        key, old = dict.popitem(self)
+        _detach(self, old)
+        _changed(self, key, old, _missing)
+        return key, old
+
+    def clear(self):
+        """Remove all items."""
+        if self._saved is not None:
+            _copy_on_write(self)
+        items = list(_iter_items(self))
+        dict.clear(self)
+        for key, old in items:
+            _detach(self, old)
+            _changed(self, key, old, _missing)
+
+    def setdefault(self, key, default=None):
+        """Return the value for key if present, else set it to default and return default."""
+        value = dict.get(self, key, _missing)
+        if value is _missing:
+            self[key] = value = default
+        return value
+
+    def _update_items(self, *args, **named_args):
+        for key, value in iteritems(dict(*args, **named_args)):
+            self[key] = value
+
+    def __ior__(self, other):
+        _tracked_nested_dict._update_items(self, other)
+        return self
+
+
+#
+#   attributes of tracked levels not copied or pickled
+#
+_tracking_attributes = ('_parent', '_key', '_aggregates', '_caching_aggregates', '_digest',
+                        '_caching_digests', '_indexes', '_sizes', '_snapshots', '_former',
+                        '_saved', '_history')
+
+#
+#   Tracked subclass for each class of nested level
+#
+_tracked_types = {}
+
+
+def _tracked_type(cls):
+    tracked = _tracked_types.get(cls)
+    if tracked is None:
+        namespace = {'__slots__': (), '__module__': cls.__module__, '_untracked_type': cls}
+        # dict.update would bypass __setitem__ (nested_dict.update already goes through it)
+        if getattr(cls, "update") is dict.update:
+            namespace['update'] = _tracked_nested_dict._update_items
+        tracked = _tracked_types[cls] = type(cls.__name__, (_tracked_nested_dict, cls), namespace)
+    return tracked
+
+
+def _track(nd, parent=None, key=None):
+    """Switch nd, and the nested levels below it, to tracked levels in place."""
+    stack = [(nd, parent, key)]
+    while stack:
+        nd, parent, key = stack.pop()
+        if isinstance(nd, _tracked_nested_dict):
+            # already tracked, with the levels below it
+            if nd._parent is not parent:
+                _keep_snapshots(nd)
+            nd._parent = parent
+            nd._key = key
+            continue
+        nd.__class__ = _tracked_type(nd.__class__)
+        nd._parent = parent
+        nd._key = key
+        for key, value in _iter_items(nd):
+            if isinstance(value, _recursive_dict):
+                stack.append((value, nd, key))
+
+
+def _detach(nd, old):
+    """Disconnect old, a value removed from tracked level nd, from nd if it was a level of nd."""
+    if isinstance(old, _tracked_nested_dict) and old._parent is nd:
+        _keep_snapshots(old)
+        old._parent = old._key = None
+
+
+def _untrack(nd):
+    """
+    Switch nd, and the tracked levels below it, back to untracked levels.
+
+    Levels below which have tracking turned on themselves are left tracked.
+    """
+    stack = [nd]
+    while stack:
+        nd = stack.pop()
+        if not isinstance(nd, _tracked_nested_dict):
+            continue
+        if nd._parent is not None and _has_settings(nd):
+            nd._parent = nd._key = None
+            continue
+        nd.__class__ = nd._untracked_type
+        for attribute in _tracking_attributes:
+            nd.__dict__.pop(attribute, None)
+        stack.extend(_iter_values(nd))
+
+
+def _has_settings(nd):
+    """Whether tracking was turned on for tracked level nd itself."""
+    if nd._caching_aggregates or nd._caching_digests or nd._indexes:
+        return True
+    return nd._sizes is not None or nd._snapshots is not None
+
+
+def _stop_tracking(nd):
+    """Untrack nd if nothing needs tracking any more."""
+    if nd._parent is None and not _has_settings(nd):
+        _untrack(nd)
+
+
+def _changed(nd, key, old, new):
+    """
+    Record a change of the value for key in tracked level nd from old to new (or _missing).
+
+    Invalidates the cached aggregates and digests of nd and the levels above it, and
+    updates the key indexes and sizes of nd or the levels above it.
+    """
+    indexed = False
+    size_change = _missing
+    depth = 0
+    level = nd
+    while level is not None:
+        if level._aggregates is not None:
+            level._aggregates = None
+        if level._digest is not None:
+            level._digest = None
+        if level._indexes:
+            indexed = True
+        if level._sizes is not None:
+            if size_change is _missing:
+                size_change = _size_change(old, new) if old is not new else None
+            if size_change is not None:
+                _add_sizes(level._sizes, size_change, depth)
+        depth += 1
+        level = level._parent
+    if not indexed or old is new:
+        return
+
+    # paths are relative to the level holding the index
+    keys = []
+    level = nd
+    while level is not None:
+        if level._indexes:
+            parent_path = tuple(reversed(keys))
+            for index_level, index in iteritems(level._indexes):
+                _reindex(index, index_level, parent_path, key, old, new)
+        keys.append(level._key)
+        level = level._parent
+
+
+#
+#   Snapshots: copy on write
+#
+#   Each snapshot has an epoch, counted for all dictionaries, so that epochs can be compared
+#   wherever snapshots are taken. Each level on which snapshot() is called keeps the last
+#   epoch and the live snapshots of its own snapshots (in _snapshots). Before a tracked level
+#   is first changed after a snapshot of it or of a level above it is taken, a copy of its
+#   items is kept, for the snapshots taken since it was last copied. Snapshots read a level
+#   from the first copy kept at or after their epoch, or from the level itself if it has not
+#   been changed since. Snapshots of other dictionaries do not cause copies. A level moved to
+#   another parent keeps the live snapshots of the levels it was under (in _former), and
+#   each copy is kept while any of the snapshots which were live when it was made is.
+#
+class _snapshot_epoch(object):
+    """Token for one snapshot: copies are kept while it is alive."""
+
+    __slots__ = ('epoch', '__weakref__')
+
+    def __init__(self, epoch):
+        self.epoch = epoch
+
+
+class _snapshot_epochs(object):
+    """The epoch of the last snapshot of a level, and the tokens of its live snapshots."""
+
+    __slots__ = ('epoch', 'live')
+
+    # the last epoch of any snapshot
+    last = 0
+
+    def __init__(self):
+        self.epoch = 0
+        # (a WeakSet, which python 2.6 does not have)
+        self.live = weakref.WeakKeyDictionary()
+
+    def new_epoch(self):
+        _snapshot_epochs.last += 1
+        self.epoch = _snapshot_epochs.last
+        token = _snapshot_epoch(self.epoch)
+        self.live[token] = None
+        return token
+
+
+def _version(nd):
+    """Start copying nd, and the tracked levels below it, on write for snapshots."""
+    epoch = _snapshot_epochs.last
+    stack = [nd]
+    while stack:
+        nd = stack.pop()
+        if nd._saved is None:
+            nd._saved = epoch
+            stack.extend([value for value in _iter_values(nd)
+                          if isinstance(value, _tracked_nested_dict)])
+
+
+def _snapshot_clocks(nd):
+    """Return the _snapshot_epochs of the snapshots which can read tracked level nd."""
+    clocks = []
+    level = nd
+    while level is not None:
+        if level._snapshots is not None:
+            clocks.append(level._snapshots)
+        if level._former is not None:
+            clocks.append(level._former)
+        level = level._parent
+    return clocks
+
+
+def _keep_snapshots(nd):
+    """Before tracked level nd is moved from its parent, keep the snapshots which can read it."""
+    saved = nd._saved
+    if saved is None or nd._parent is None:
+        return
+    former = nd._former
+    for clock in _snapshot_clocks(nd._parent):
+        for token in list(clock.live):
+            if token.epoch > saved:
+                if former is None:
+                    former = nd._former = _snapshot_epochs()
+                former.live[token] = None
+                if token.epoch > former.epoch:
+                    former.epoch = token.epoch
+
+
+def _copy_on_write(nd):
+    """
+    Keep a copy of the items of nd, before it is changed, for the snapshots which need it.
+
+    These are the snapshots which can read nd (see _snapshot_clocks) taken since nd was
+    last copied.
+    """
+    saved = nd._saved
+    clocks = _snapshot_clocks(nd)
+    latest = saved
+    for clock in clocks:
+        if clock.epoch > latest:
+            latest = clock.epoch
+    if latest == saved:
+        return
+    nd._saved = latest
+    tokens = [token for clock in clocks for token in list(clock.live) if token.epoch > saved]
+    if not tokens:
+        return
+    # copies are no longer needed once all the snapshots which read them are gone
+    history = [entry for entry in nd._history or ()
+               if any(ref() is not None for ref in entry[2])]
+    history.append((nd._saved, dict.copy(nd), [weakref.ref(token) for token in tokens]))
+    # replaced, not changed, so that readers can use the old list
+    nd._history = history
+
+
+def _saved_items(nd, epoch):
+    """Return the copy of the items of nd kept for snapshot epoch, or None if nd is unchanged."""
+    history = getattr(nd, "_history", None)
+    if history:
+        for saved_epoch, items, _ in history:
+            if saved_epoch >= epoch:
+                return items
+    return None
+
+
+class nested_dict_snapshot(Mapping):
+    """
+    Read-only view of a nested dictionary (or one of its levels) as it was at a snapshot.
+
+    Returned by ``snapshot()``. Levels are only copied when changed (see _copy_on_write),
+    so a snapshot reads from the levels of the dictionary itself where they have not been
+    changed since.
+    """
+
+    __slots__ = ('_nd', '_token')
+
+    def __init__(self, nd, token):
+        """View level nd as it was at the snapshot with token, a _snapshot_epoch."""
+        self._nd = nd
+        self._token = token
+
+    def _items(self):
+        """Return the items of the level at this epoch, as a dict."""
+        nd = self._nd
+        epoch = self._token.epoch
+        items = _saved_items(nd, epoch)
+        if items is None:
+            items = dict.copy(nd)
+            # a copy kept (and nd changed) meanwhile
+            saved = _saved_items(nd, epoch)
+            if saved is not None:
+                items = saved
+        return items
+
+    def _wrap(self, value):
+        if isinstance(value, _tracked_nested_dict):
+            return nested_dict_snapshot(value, self._token)
+        return value
+
+    def _get(self, key):
+        nd = self._nd
+        epoch = self._token.epoch
+        items = _saved_items(nd, epoch)
+        if items is None:
+            value = dict.get(nd, key, _missing)
+            items = _saved_items(nd, epoch)
+        if items is not None:
+            value = items.get(key, _missing)
+        return value
+
+    def __getitem__(self, key):
+        """Return the value for key, with nested levels as snapshots too."""
+        value = self._get(key)
+        if value is _missing:
+            raise KeyError(key)
+        return self._wrap(value)
+
+    def __iter__(self):
+        """Iterate through the keys of the level at the snapshot."""
+        return iter(list(self._items()))
+
+    def __len__(self):
+        """Return the number of keys of the level at the snapshot."""
+        return len(self._items())
+
+    def __contains__(self, key):
+        """Return whether key was in the level at the snapshot."""
+        return self._get(key) is not _missing
+
+    def iteritems_flat(self):
+        """Iterate through items with nested keys flattened into a tuple."""
+        return flatten_nested_items(self)
+
+    def iterkeys_flat(self):
+        """Iterate through keys with nested keys flattened into a tuple."""
+        return (key for key, value in flatten_nested_items(self))
+
+    def itervalues_flat(self):
+        """Iterate through values with nested keys flattened into a tuple."""
+        return flatten_nested_values(self)
+
+    items_flat = iteritems_flat
+    keys_flat = iterkeys_flat
+    values_flat = itervalues_flat
+
+    def get_path(self, path, default=None):
+        """Return the value for the sequence of keys in `path`, or default."""
+        node = self
+        for key in path:
+            if not isinstance(node, Mapping):
+                return default
+            node = node.get(key, _missing)
+            if node is _missing:
+                return default
+        return node
+
+    def to_dict(self):
+        """Convert to a nested series of standard ``dict`` objects."""
+        plain_dict = dict()
+        stack = [(self, plain_dict)]
+        while stack:
+            snapshot, plain = stack.pop()
+            for key, value in iteritems(snapshot._items()):
+                if isinstance(value, _tracked_nested_dict):
+                    plain[key] = plain_value = dict()
+                    stack.append((snapshot._wrap(value), plain_value))
+                else:
+                    plain[key] = value
+        return plain_dict
+
+    def __repr__(self):
+        """Representation of self, as the snapshot's contents."""
+        return "%s(%r)" % (self.__class__.__name__, self.to_dict())
+
+
+#
+#   Sizes: [number of values, number of keys at each level...]
+#
+def _count_sizes(nd):
+    """Return [number of values, number of keys at level 0, at level 1, ...] of nd."""
+    sizes = [0]
+    nested_types = _nested_types
+    stack = [(1, nd)]
+    while stack:
+        depth, nd = stack.pop()
+        if len(sizes) == depth:
+            sizes.append(0)
+        sizes[depth] += len(nd)
+        for value in _iter_values(nd):
+            is_nested = nested_types.get(value.__class__)
+            if is_nested is None:
+                is_nested = _is_nested_type(value.__class__)
+            if is_nested:
+                stack.append((depth + 1, value))
+            else:
+                sizes[0] += 1
+    return sizes
+
+
+def _size_change(old, new):
+    """
+    Return the change in sizes (as for _count_sizes) when a value changes from old to new.
+
+    Either may be _missing. Returns None if the sizes do not change.
+    """
+    nested_types = _nested_types
+    if old is not _missing and new is not _missing:
+        if nested_types.get(old.__class__) is False and nested_types.get(new.__class__) is False:
+            # a value replaced by a value
+            return None
+    change = [0, 0]
+    for value, sign in ((old, -1), (new, 1)):
+        if value is _missing:
+            continue
+        change[1] += sign
+        is_nested = nested_types.get(value.__class__)
+        if is_nested is None:
+            is_nested = _is_nested_type(value.__class__)
+        if not is_nested:
+            change[0] += sign
+            continue
+        if not value:
+            continue
+        for depth, size in enumerate(_count_sizes(value)):
+            if depth == 0:
+                change[0] += sign * size
+            elif depth + 1 == len(change):
+                change.append(sign * size)
+            else:
+                change[depth + 1] += sign * size
+    if not any(change):
+        return None
+    return change
+
+
+def _add_sizes(sizes, change, depth):
+    """Add change (from _size_change) to sizes, for a change in a level depth levels down."""
+    sizes[0] += change[0]
+    for level, size in enumerate(change[1:], depth + 1):
+        while len(sizes) <= level:
+            sizes.append(0)
+        sizes[level] += size
+
+
+#
+#   Key indexes: key -> set of paths to the levels holding that key (at one level of nesting)
+#
+def _reindex(index, index_level, parent_path, key, old, new):
+    """Update index for a change of key (from old to new) in the level at parent_path."""
+    depth = len(parent_path)
+    if depth == index_level:
+        if old is _missing:
+            _index_keys(index, index_level, parent_path, {key: new})
+        elif new is _missing:
+            _index_keys(index, index_level, parent_path, {key: old}, remove=True)
+    elif depth < index_level:
+        path = parent_path + (key,)
+        if old is not _missing and _is_nested_type(old.__class__):
+            _index_keys(index, index_level, path, old, remove=True)
+        if new is not _missing and _is_nested_type(new.__class__):
+            _index_keys(index, index_level, path, new)
+
+
+def _index_keys(index, index_level, path, nd, remove=False):
+    """Add (or remove) the keys at index_level below nd, at path, to index."""
+    nested_types = _nested_types
+    stack = [(path, nd)]
+    while stack:
+        path, nd = stack.pop()
+        if len(path) == index_level:
+            for key in nd:
+                paths = index.get(key)
+                if remove:
+                    if paths is not None:
+                        paths.discard(path)
+                        if not paths:
+                            del index[key]
+                elif paths is None:
+                    index[key] = set([path])
+                else:
+                    paths.add(path)
+            continue
+        for key, value in _iter_items(nd):
+            is_nested = nested_types.get(value.__class__)
+            if is_nested is None:
+                is_nested = _is_nested_type(value.__class__)
+            if is_nested:
+                stack.append((path + (key,), value))
+
+
+def _untracked_class_and_state(nd):
+    """Return the class and instance ``__dict__`` of nd, less any tracking, to copy or pickle."""
+    cls = nd.__class__
+    state = getattr(nd, "__dict__", None) or None
+    if state and isinstance(nd, _tracked_nested_dict):
+        state = dict((key, value) for key, value in iteritems(state)
+                     if key not in _tracking_attributes) or None
+    return getattr(cls, "_untracked_type", cls), state
+
+
+#
+#   aggregate() functions: name -> (function of the values of a level and the aggregates of
+#   its nested levels, function to count the values first if any, aggregate of no values)
+#
+def _count_values(values):
+    return [len(values)]
+
+
+_aggregate_functions = {
+    'sum': (sum, None, 0),
+    'count': (sum, _count_values, 0),
+    'min': (min, None, _missing),
+    'max': (max, None, _missing),
+}
+
+
+def _aggregate(nd, how):
+    """
+    Return the aggregate `how` (e.g. 'sum') of all the values nested in nd, or _missing if none.
+
+    Uses an explicit stack, and the cached aggregates of tracked levels where present.
+    Aggregates are cached for tracked levels if no level below them could change without
+    invalidating them, i.e. all are tracked (or frozen).
+    """
+    try:
+        reduce_values, prepare, empty = _aggregate_functions[how]
+    except (KeyError, TypeError):
+        raise ValueError("aggregate should be one of %s (not %r)"
+                         % (", ".join(sorted(_aggregate_functions)), how))
+    cached = getattr(nd, "_aggregates", None)
+    if cached is not None and how in cached:
+        return cached[how]
+
+    caching = False
+    level = nd
+    while isinstance(level, _tracked_nested_dict):
+        if level._caching_aggregates:
+            caching = True
+            break
+        level = level._parent
+
+    nested_types = _nested_types
+    # level, iterator over values, values, aggregates of nested levels, can be cached
+    stack = [[nd, _iter_values(nd), [], [], True]]
+    while True:
+        frame = stack[-1]
+        for value in frame[1]:
+            is_nested = nested_types.get(value.__class__)
+            if is_nested is None:
+                is_nested = _is_nested_type(value.__class__)
+            if not is_nested:
+                frame[2].append(value)
+                continue
+            cached = getattr(value, "_aggregates", None)
+            if cached is not None and how in cached:
+                if cached[how] is not _missing:
+                    frame[3].append(cached[how])
+                continue
+            stack.append([value, _iter_values(value), [], [],
+                          isinstance(value, (_tracked_nested_dict, _frozen_nested_dict))])
+            break
+        else:
+            stack.pop()
+            nd, values, aggregates, cacheable = frame[0], frame[2], frame[3], frame[4]
+            if prepare is not None:
+                values = prepare(values)
+            values.extend(aggregates)
+            result = reduce_values(values) if values else empty
+            if caching and cacheable and isinstance(nd, _tracked_nested_dict):
+                if nd._aggregates is None:
+                    nd._aggregates = dict()
+                nd._aggregates[how] = result
+            if not stack:
+                return result
+            if result is not _missing:
+                stack[-1][3].append(result)
+            if not cacheable:
+                stack[-1][4] = False
+
+
+if sys.hexversion < 0x03000000:
+    _text_type = unicode                # noqa: F821
+    _integer_types = (int, long)        # noqa: F821
+
+    def _utf8(text):
+        return text.encode('utf-8')
+else:
+    _text_type = str
+    _integer_types = (int,)
+
+    def _utf8(text):
+        # (str may hold lone surrogates)
+        return text.encode('utf-8', 'surrogatepass')
+
+_infinity = float('inf')
+
+
+def _number_text(value):
+    """Encode a number for _digest_text(), the same for equal numbers of different types."""
+    if isinstance(value, _integer_types):
+        # bool too
+        return 'i%d;' % value
+    if isinstance(value, float):
+        if value == value and value not in (_infinity, -_infinity) and value == int(value):
+            return 'i%d;' % int(value)
+        return 'f%r;' % value
+    if isinstance(value, complex):
+        if not value.imag:
+            return _number_text(value.real)
+        return 'c%r;' % value
+    # e.g. Fraction or Decimal
+    try:
+        as_float = float(value)
+    except (TypeError, ValueError, OverflowError):
+        as_float = None
+    if as_float is not None and as_float == value:
+        return _number_text(as_float)
+    return _other_text(value)
+
+
+def _other_text(value):
+    text = repr(value)
+    return 'r%s:%d:%s' % (value.__class__.__name__, len(text), text)
+
+
+def _digest_text(value):
+    """
+    Encode value (a key or a value) as text for hashing, the same in every process.
+
+    Values which compare equal are encoded alike: numbers by value (so 1, 1.0 and True
+    alike), strings as text (on python 2, ascii str as unicode), and tuples, lists and
+    sets by their items. Other values are encoded by their type name and repr(). Each
+    encoding is self-delimiting, so encodings can be concatenated without ambiguity.
+    """
+    cls = value.__class__
+    if cls is _text_type:
+        return 's%d:%s' % (len(value), value)
+    if cls is int:
+        return 'i%d;' % value
+    if value is None:
+        return 'N'
+    if isinstance(value, _text_type):
+        return 's%d:%s' % (len(value), value)
+    if isinstance(value, bytes):
+        if sys.hexversion < 0x03000000:
+            try:
+                # equal to the unicode string
+                return _digest_text(value.decode('ascii'))
+            except UnicodeDecodeError:
+                pass
+        return 'b%d:%s' % (len(value), value.decode('latin-1'))
+    if isinstance(value, (tuple, list)):
+        tag = 't' if isinstance(value, tuple) else 'l'
+        return '%s%d:%s' % (tag, len(value), ''.join([_digest_text(item) for item in value]))
+    if isinstance(value, (set, frozenset)):
+        return 'S%d:%s' % (len(value), ''.join(sorted([_digest_text(item) for item in value])))
+    if isinstance(value, numbers.Number):
+        return _number_text(value)
+    return _other_text(value)
+
+
+def _level_digest(nd):
+    """
+    Return the digest of the nested level nd, a Merkle tree of the digests of its levels.
+
+    The digest is the hash of its encoded items, in sorted order, with nested levels
+    encoded by their own digests.
+
+    Uses an explicit stack, and the cached digests of tracked levels where present.
+    Digests are cached for tracked levels if no level below them could change without
+    invalidating them, as for _aggregate().
+    """
+    cached = getattr(nd, "_digest", None)
+    if cached is not None:
+        return cached
+
+    caching = False
+    level = nd
+    while isinstance(level, _tracked_nested_dict):
+        if level._caching_digests:
+            caching = True
+            break
+        level = level._parent
+
+    nested_types = _nested_types
+    sha1 = hashlib.sha1
+    digest_text = _digest_text
+    # level, iterator over items, encoded items, can be cached, key in the level above
+    stack = [[nd, _iter_items(nd), [], True, None]]
+    while True:
+        frame = stack[-1]
+        encoded = frame[2]
+        for key, value in frame[1]:
+            is_nested = nested_types.get(value.__class__)
+            if is_nested is None:
+                is_nested = _is_nested_type(value.__class__)
+            if not is_nested:
+                encoded.append('v' + digest_text(key) + digest_text(value))
+                continue
+            cached = getattr(value, "_digest", None)
+            if cached is not None:
+                encoded.append('l' + digest_text(key) + hexlify(cached).decode('ascii'))
+                continue
+            stack.append([value, _iter_items(value), [], isinstance(value, _tracked_nested_dict),
+                          key])
+            break
+        else:
+            stack.pop()
+            nd, cacheable, key = frame[0], frame[3], frame[4]
+            encoded.sort()
+            result = sha1(_utf8(''.join(encoded))).digest()
+            if caching and cacheable and isinstance(nd, _tracked_nested_dict):
+                nd._digest = result
+            if not stack:
+                return result
+            stack[-1][2].append('l' + digest_text(key) + hexlify(result).decode('ascii'))
+            if not cacheable:
+                stack[-1][3] = False
+
+
 # _________________________________________________________________________________________
 #
 #   nested_dict
@@ -188,10 +2122,142 @@ class nested_dict(_recursive_dict):
     Uses defaultdict to automatically add levels of nested dicts and other types.
     """
 
+    @classmethod
+    def from_items_flat(cls, iterable, levels=None, leaf_type=None):
+        """
+        Build a nested_dict from (key tuple, value) pairs, the inverse of ``items_flat()``.
+
+        levels and leaf_type are as for the constructor, ``nested_dict(levels, leaf_type)``.
+        """
+        nd = _new_nested_dict(cls, levels, leaf_type)
+        nd.update_flat(iterable)
+        return nd
+
+    @classmethod
+    def from_dict(cls, orig_dict, levels=None, leaf_type=None):
+        """
+        Build a nested_dict from an existing (nested) dict.
+
+        levels and leaf_type are as for the constructor, ``nested_dict(levels, leaf_type)``,
+        so that the nested levels are created with the right default factories. Without
+        them, this is the same as ``nested_dict(orig_dict)``.
+        """
+        nd = _new_nested_dict(cls, levels, leaf_type)
+        return _update_from_dict(nd, orig_dict, levels is not None)
+
+    @classmethod
+    def load_json(cls, fp, levels=None, leaf_type=None):
+        """
+        Read a JSON object from the file-like object fp into a nested_dict.
+
+        levels and leaf_type are as for the constructor, ``nested_dict(levels, leaf_type)``.
+
+        The nested levels are built as the JSON is parsed (with ``object_pairs_hook``)
+        rather than copied from plain dicts afterwards. As for ``nested_dict(json.load(fp))``,
+        objects inside arrays are plain dicts, and as for ``from_dict()``, so are objects
+        nested deeper than levels.
+        """
+        import json
+        nd = _new_nested_dict(cls, levels, leaf_type)
+
+        if levels is None:
+            def make_level(pairs):
+                level = nested_dict()
+                dict.update(level, pairs)
+                return level
+        else:
+            def make_level(pairs):
+                level = _recursive_dict()
+                dict.update(level, pairs)
+                return level
+
+        parsed = json.load(fp, object_pairs_hook=make_level)
+        if not isinstance(parsed, dict):
+            raise ValueError("JSON for a nested_dict should be an object, not %s"
+                             % parsed.__class__.__name__)
+        dict.update(nd, parsed)
+        _plain_dicts_in_lists(nd)
+        if levels is not None:
+            _set_level_factories(nd)
+        return nd
+
+    @staticmethod
+    def open(filename):
+        """
+        Open a binary snapshot written by save(), as a read-only ``mapped_nested_dict``.
+
+        The file is memory mapped, and each top level key's value is only decoded when
+        first accessed. The file is read with pickle: only open files from trusted sources.
+        """
+        from .binary import mapped_nested_dict
+        return mapped_nested_dict(filename)
+
+    @staticmethod
+    def merge_many(dicts, combine=operator.add, workers=None):
+        """
+        Merge many (nested) dictionaries into a new nested_dict.
+
+        Values present in more than one dictionary are combined with combine(a, b), or
+        any of the on_conflict strategies of merge(), e.g. 'max'.
+        The result has the same levels and type of values as the first dictionary.
+
+        If workers > 1, the top level keys are split into that many shards, which are
+        merged in parallel in a ``multiprocessing`` pool (so the dictionaries and combine
+        must be picklable). Falls back to merging serially if a pool cannot be created.
+        """
+        dicts = list(dicts)
+        if not dicts:
+            return nested_dict()
+        result = _empty_like(dicts[0])
+        if workers is None or workers < 2 or len(dicts) < 2:
+            combine, in_place = _merge_strategy(combine)
+            for other in dicts:
+                _merge_into(result, other, combine, in_place=in_place)
+            return result
+
+        try:
+            import multiprocessing
+            pool = multiprocessing.Pool(workers)
+        except (ImportError, OSError, NotImplementedError):
+            return nested_dict.merge_many(dicts, combine)
+
+        try:
+            shards = [[dict() for other in dicts] for shard in range(workers)]
+            for index, other in enumerate(dicts):
+                for key, value in _iter_items(other):
+                    shards[hash(key) % workers][index][key] = value
+            merged = pool.map(_merge_shard, [(result, shard, combine) for shard in shards])
+        finally:
+            pool.close()
+            pool.join()
+        for shard in merged:
+            dict.update(result, shard)
+        return result
+
     def update(self, other):
         """Update recursively."""
         _recursive_update(self, other)
 
+    def merge(self, other, on_conflict='overwrite', steal=False):
+        """
+        Merge other (a nested dictionary) into this one.
+
+        on_conflict says what to do with values present in both:
+
+            'overwrite' (the default): use other's value, as for update()
+            'sum', 'max', 'min': add, or take the maximum or minimum of the two values
+            'extend', 'union': extend this value (e.g. a list or a set) in place with other's
+            any function f(mine, others) returning the new value
+
+        Where one has a nested level and the other a value, other's is used.
+
+        Nested levels are merged without auto-vivification, so no empty levels are created.
+        Nested levels only in other are copied, unless steal is True, in which case they are
+        put into this dictionary as they are (other should not be used afterwards).
+        """
+        combine, in_place = _merge_strategy(on_conflict)
+        _merge_into(self, other, combine, steal, in_place)
+
     def __init__(self, *param, **named_param):
         """
         Constructor.
@@ -215,7 +2281,7 @@ class nested_dict(_recursive_dict):
             if isinstance(param[0], dict):
                 self.factory = nested_dict
                 defaultdict.__init__(self, self.factory)
-                nested_dict_from_dict(param[0], self)
+                _update_from_dict(self, param[0], False)
                 return
 
         if len(param) == 2:
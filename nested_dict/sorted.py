@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+"""`sorted_nested_dict` keeps its keys in order, for range scans and ordered iteration."""
+from __future__ import print_function
+from __future__ import division
+
+################################################################################
+#
+#   sorted.py
+#
+#   Copyright (c) 2009, 2015 Leo Goodstadt
+#
+#   Permission is hereby granted, free of charge, to any person obtaining a copy
+#   of this software and associated documentation files (the "Software"), to deal
+#   in the Software without restriction, including without limitation the rights
+#   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#   copies of the Software, and to permit persons to whom the Software is
+#   furnished to do so, subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be included in
+#   all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+#   THE SOFTWARE.
+#
+#################################################################################
+
+from bisect import bisect_left, bisect_right, insort
+
+from .flat import _flat_view, _missing, flat_nested_dict
+
+
+class _greatest(object):
+    """Greater than any key: ``prefix + (_greatest,)`` sorts after all paths below prefix."""
+
+    def __lt__(self, other):
+        return False
+
+    def __gt__(self, other):
+        return True
+
+
+_greatest = _greatest()
+
+#
+#   Up to this many new paths are inserted one by one (each moves the paths after it)
+#   rather than sorted in with all the others (which compares every path)
+#
+_insort_limit = 256
+
+
+class _sorted_view(_flat_view):
+    """An intermediate level of a `sorted_nested_dict`."""
+
+    __slots__ = ()
+
+    def irange_flat(self, lo=None, hi=None, inclusive=(True, True)):
+        """
+        Iterate in order through items with nested keys flattened into a tuple, from lo to hi.
+
+        lo and hi are tuples of (leading) keys, compared with the same number of keys of
+        each item, so that ``irange_flat(('a',), ('c',))`` includes all items below
+        ``'a'``, ``'b'`` and ``'c'``. None means no limit. inclusive says whether items at
+        lo and hi themselves are included.
+        """
+        prefix = self._prefix
+        depth = len(prefix)
+        lower = upper = None
+        if lo is not None:
+            lower = (prefix + tuple(lo), inclusive[0])
+        if hi is not None:
+            upper = (prefix + tuple(hi), inclusive[1])
+        paths, data, start, end = self._root._range(prefix, lower, upper)
+        for index in range(start, end):
+            path = paths[index]
+            yield path[depth:], data[path]
+
+    def first_n(self, n):
+        """Return the first n items in order, with nested keys flattened into a tuple."""
+        prefix = self._prefix
+        depth = len(prefix)
+        paths, data, start, end = self._root._range(prefix, None, None)
+        return [(path[depth:], data[path]) for path in paths[start:min(end, start + n)]]
+
+
+class sorted_nested_dict(_sorted_view, flat_nested_dict):
+    """
+    Nested dict with a fixed number of levels, iterated in key order.
+
+    As for `flat_nested_dict`, values are held in one ``dict`` keyed by the tuple of keys.
+    The tuples are also kept in a sorted list, so that the items below any level, or
+    between two keys, are found by bisection. New keys are appended to an unsorted list,
+    which is sorted into the rest only when next needed, so adding many keys in a row is
+    cheap.
+    """
+
+    __slots__ = ('_paths', '_new_paths')
+
+    # class of the views returned for intermediate levels
+    _view_type = _sorted_view
+
+    def __init__(self, levels, leaf_type=None):
+        """
+        Create an empty dictionary with a fixed number of levels, kept in key order.
+
+        :param levels: the (fixed) number of nested levels
+        :param leaf_type: optional factory for missing leaves, as for ``nested_dict(levels, type)``
+        """
+        flat_nested_dict.__init__(self, levels, leaf_type)
+        self._paths = []
+        self._new_paths = []
+
+    def _sorted_paths(self):
+        """Return the sorted list of all paths."""
+        new_paths = self._new_paths
+        if new_paths:
+            paths = self._paths
+            if len(new_paths) <= _insort_limit:
+                for path in new_paths:
+                    insort(paths, path)
+            else:
+                # two sorted runs: merged in linear time
+                new_paths.sort()
+                paths.extend(new_paths)
+                paths.sort()
+            self._new_paths = []
+        return self._paths
+
+    def _range(self, prefix, lower, upper):
+        """
+        Return (sorted paths, data, start, end) for the paths below prefix within bounds.
+
+        paths[start:end] are the paths starting with prefix and within the (path, inclusive)
+        bounds lower and upper.
+        """
+        paths = self._sorted_paths()
+        if lower is None:
+            start = bisect_left(paths, prefix)
+        elif lower[1]:
+            start = bisect_left(paths, lower[0])
+        else:
+            start = bisect_right(paths, lower[0] + (_greatest,))
+        if upper is None:
+            end = bisect_right(paths, prefix + (_greatest,), start) if prefix else len(paths)
+        elif upper[1]:
+            end = bisect_right(paths, upper[0] + (_greatest,), start)
+        else:
+            end = bisect_left(paths, upper[0], start)
+        return paths, self._data, start, max(start, end)
+
+    #
+    #   Storage primitives, as for flat_nested_dict
+    #
+    def _get_leaf(self, path):
+        value = self._data.get(path, _missing)
+        if value is _missing:
+            if self.leaf_type is None:
+                raise KeyError(path[-1])
+            value = self.leaf_type()
+            self._set(path, value)
+        return value
+
+    def _set(self, path, value):
+        data = self._data
+        if path not in data:
+            self._new_paths.append(path)
+        data[path] = value
+
+    def _del(self, path):
+        try:
+            del self._data[path]
+        except KeyError:
+            raise KeyError(path[-1])
+        paths = self._sorted_paths()
+        del paths[bisect_left(paths, path)]
+
+    def _iter_prefix(self, prefix):
+        paths, data, start, end = self._range(prefix, None, None)
+        for index in range(start, end):
+            path = paths[index]
+            yield path, data[path]
+
+    def _has_prefix(self, prefix):
+        paths, data, start, end = self._range(prefix, None, None)
+        return start < end
+
+    # from the sorted paths rather than the counts of flat_nested_dict
+    def _len_keys(self, prefix):
+        return _flat_view._len_keys(self, prefix)
+
+    def _del_prefix(self, prefix):
+        paths, data, start, end = self._range(prefix, None, None)
+        for path in paths[start:end]:
+            del data[path]
+        del paths[start:end]
+        return start < end
@@ -157,6 +157,280 @@ class Test_nested_dict_methods(unittest.TestCase):
         a['A']['B'] = 15
         self.assertEqual(sorted(a.itervalues_flat()), [3, 15])
 
+    def test_items_flat_limits(self):
+        """Test items_flat and keys_flat with prefix, max_depth and min_depth, and keys_at_level."""
+        import nested_dict
+        a = nested_dict.nested_dict()
+        a['eu']['fr']['paris'] = 1
+        a['eu']['fr']['lyon'] = 2
+        a['eu']['de']['berlin'] = 3
+        a['us']['ca'] = 4
+        a['un'] = 5
+        self.assertEqual(sorted(a.items_flat(prefix=('eu',))),
+                         [(('eu', 'de', 'berlin'), 3), (('eu', 'fr', 'lyon'), 2),
+                          (('eu', 'fr', 'paris'), 1)])
+        self.assertEqual(list(a.items_flat(prefix=('eu', 'de', 'berlin'))),
+                         [(('eu', 'de', 'berlin'), 3)])
+        self.assertEqual(list(a.items_flat(prefix=('nowhere', 'x'))), [])
+        self.assertFalse('nowhere' in a)
+        self.assertEqual(sorted(a.items_flat(max_depth=2)),
+                         [(('eu', 'de'), {'berlin': 3}), (('eu', 'fr'), {'paris': 1, 'lyon': 2}),
+                          (('un',), 5), (('us', 'ca'), 4)])
+        self.assertEqual(sorted(a.keys_flat(min_depth=2, max_depth=2)),
+                         [('eu', 'de'), ('eu', 'fr'), ('us', 'ca')])
+        self.assertEqual(sorted(a.keys_flat(prefix=['eu'], min_depth=3)),
+                         [('eu', 'de', 'berlin'), ('eu', 'fr', 'lyon'), ('eu', 'fr', 'paris')])
+        self.assertEqual(sorted(a.keys_at_level(0)), [('eu',), ('un',), ('us',)])
+        self.assertEqual(sorted(a.keys_at_level(1)), [('eu', 'de'), ('eu', 'fr'), ('us', 'ca')])
+        self.assertEqual(list(a.keys_at_level(3)), [])
+
+    def test_flat_deep_nesting(self):
+        """Test *_flat methods on trees nested deeper than the recursion limit."""
+        import nested_dict
+        a = nested_dict.nested_dict()
+        depth = sys.getrecursionlimit() + 100
+        node = a
+        for level in range(depth - 1):
+            node = node[level]
+        node['leaf'] = 1
+        a['A']['B'] = 15
+        keys = sorted(a.keys_flat(), key=len)
+        self.assertEqual(keys[0], ('A', 'B'))
+        self.assertEqual(keys[1], tuple(range(depth - 1)) + ('leaf',))
+        self.assertEqual(sorted(a.values_flat()), [1, 15])
+        self.assertEqual(len(list(a.items_flat())), 2)
+
+    def test_path_methods(self):
+        """Test get_path, set_path, setdefault_path, del_path and has_path."""
+        import nested_dict
+        a = nested_dict.nested_dict(3, int)
+        a.set_path(('1', '2', '3'), 3)
+        a['A']['B']['C'] = 15
+        self.assertEqual(a.get_path(('1', '2', '3')), 3)
+        self.assertEqual(a.get_path(('A', 'B')), {'C': 15})
+        self.assertTrue(a.has_path(('A', 'B', 'C')))
+        self.assertFalse(a.has_path(('A', 'B', 'C', 'D')))
+        self.assertEqual(a.setdefault_path(('A', 'B', 'C'), 1), 15)
+        self.assertEqual(a.setdefault_path(('A', 'B', 'D'), 1), 1)
+        a.del_path(('A', 'B', 'D'))
+        self.assertRaises(KeyError, a.del_path, ('A', 'B', 'D'))
+        self.assertRaises(KeyError, a.del_path, ('X', 'Y', 'Z'))
+
+        # reads do not create missing levels
+        self.assertEqual(a.get_path(('X', 'Y', 'Z')), None)
+        self.assertEqual(a.get_path(('X', 'Y', 'Z'), 0), 0)
+        self.assertEqual(a.to_dict(), {'1': {'2': {'3': 3}}, 'A': {'B': {'C': 15}}})
+
+        # fixed nesting still applies
+        b = nested_dict.nested_dict(2)
+        self.assertRaises(KeyError, b.set_path, (1, 2, 3), 4)
+        self.assertRaises(KeyError, b.setdefault_path, (1, 2, 3), 4)
+
+        # as for has_path, values which are not nested levels are not stepped into
+        a['L'] = [1, 2]
+        self.assertFalse(a.has_path(('L', 0)))
+        self.assertRaises(KeyError, a.del_path, ('L', 0))
+        self.assertEqual(a['L'], [1, 2])
+
+        # missing levels are created as indexing would, with tracked levels too
+        tracked = nested_dict.nested_dict(3, int)
+        tracked.snapshot()
+        for c in (nested_dict.concurrent_nested_dict(3, int), tracked):
+            c.set_path((1, 2, 3), 4)
+            self.assertEqual(c.setdefault_path((1, 5, 6), 7), 7)
+            self.assertEqual(c.to_dict(), {1: {2: {3: 4}, 5: {6: 7}}})
+            self.assertEqual(c[1].__class__, c[8].__class__)
+
+    def test_path_accessor(self):
+        """Test indexing with a tuple of keys through the path accessor."""
+        import nested_dict
+        a = nested_dict.nested_dict()
+        a.path['1', '2', '3'] = 3
+        a.path['A', 'B'] = 15
+        self.assertEqual(a.path['1', '2', '3'], 3)
+        self.assertTrue(('A', 'B') in a.path)
+        self.assertFalse(('A', 'C') in a.path)
+        self.assertRaises(KeyError, lambda: a.path['A', 'C'])
+        del a.path['A', 'B']
+        self.assertEqual(a.to_dict(), {'1': {'2': {'3': 3}}, 'A': {}})
+        # tuples are still ordinary keys when indexing directly
+        a[(1, 2)] = 3
+        self.assertEqual(a[(1, 2)], 3)
+        self.assertFalse(1 in a)
+
+    def test_from_items_flat(self):
+        """Test from_items_flat and update_flat as the inverse of items_flat."""
+        import nested_dict
+        a = nested_dict.nested_dict(3, int)
+        a['1']['2']['3'] = 3
+        a['1']['2']['4'] = 4
+        a['A']['B']['C'] = 15
+
+        b = nested_dict.nested_dict.from_items_flat(a.items_flat(), 3, int)
+        self.assertEqual(b, a)
+        # levels and type of values preserved
+        self.assertEqual(b['X']['Y']['Z'], 0)
+        self.assertRaises(TypeError, lambda: b['X']['Y']['Z']['W'])
+
+        c = nested_dict.nested_dict.from_items_flat(iter([(('1', '2', '3'), 3), (('A', 'B'), 15)]))
+        self.assertEqual(c.to_dict(), {'1': {'2': {'3': 3}}, 'A': {'B': 15}})
+        c.update_flat([(('1', '2', '3'), 4), (('1', '5'), 5)])
+        self.assertEqual(c.to_dict(), {'1': {'2': {'3': 4}, '5': 5}, 'A': {'B': 15}})
+
+        # values which are dictionaries beyond the fixed level of nesting
+        d = nested_dict.nested_dict(2)
+        d[1][2] = {3: 4}
+        self.assertEqual(nested_dict.nested_dict.from_items_flat(d.items_flat(), 2), d)
+
+    def test_freeze(self):
+        """Test freeze method."""
+        import nested_dict
+        import pickle
+        a = nested_dict.nested_dict(3, int)
+        a['1']['2']['3'] = 3
+        a['A']['B']['C'] = 15
+        frozen = a.freeze()
+        self.assertEqual(frozen, a)
+        self.assertEqual(sorted(frozen.items_flat()), sorted(a.items_flat()))
+        self.assertEqual(sorted(frozen.values_flat()), [3, 15])
+        self.assertEqual(frozen.get_path(('A', 'B', 'C')), 15)
+        self.assertEqual(frozen.to_dict(), a.to_dict())
+        self.assertEqual(frozen.freeze(), frozen)
+
+        # lookups do not vivify
+        self.assertRaises(KeyError, lambda: frozen['X'])
+        self.assertRaises(KeyError, lambda: frozen['1']['2']['X'])
+        self.assertFalse('X' in frozen)
+
+        # immutable
+        def assign():
+            frozen['1']['2']['3'] = 4
+        self.assertRaises(TypeError, assign)
+        self.assertRaises(TypeError, frozen.update, {'X': 1})
+        self.assertRaises(TypeError, frozen['A'].pop, 'B')
+        self.assertRaises(TypeError, frozen.set_path, ('X', 'Y', 'Z'), 1)
+        self.assertEqual(a.freeze(), frozen)
+
+        # hashable, picklable, and independent of the original
+        self.assertEqual(hash(frozen), hash(a.freeze()))
+        self.assertEqual({frozen: 1}[a.freeze()], 1)
+        self.assertEqual(pickle.loads(pickle.dumps(frozen)), frozen)
+        a['1']['2']['3'] = 4
+        self.assertEqual(frozen['1']['2']['3'], 3)
+
+    def test_pickle(self):
+        """Test pickling preserves values, levels and the type of values."""
+        import nested_dict
+        import pickle
+        a = nested_dict.nested_dict()
+        a['1']['2']['3'] = 3
+        a['A']['B'] = 15
+        a['empty']['level']
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            b = pickle.loads(pickle.dumps(a, protocol))
+            self.assertEqual(b, a)
+            self.assertTrue(isinstance(b, nested_dict.nested_dict))
+            b['X']['Y']['Z'] = 1
+
+        a = nested_dict.nested_dict(3, list)
+        a[1][2][3].append(4)
+        b = pickle.loads(pickle.dumps(a))
+        self.assertEqual(b, a)
+        b[1][2][5].append(6)
+        b[2][3][4].append(5)
+        self.assertEqual(b.to_dict(), {1: {2: {3: [4], 5: [6]}}, 2: {3: {4: [5]}}})
+        self.assertEqual(pickle.loads(pickle.dumps(a[1])), a[1])
+
+        a = nested_dict.nested_dict(2)
+        a[1][2] = 3
+        b = pickle.loads(pickle.dumps(a))
+        self.assertRaises(KeyError, lambda: b[1][3])
+
+        # other mappings are values, unchanged
+        from collections import Counter, OrderedDict
+        a = nested_dict.nested_dict(2, Counter)
+        a[1][2]['x'] += 1
+        a[1][3] = OrderedDict([('z', 1), ('y', 2)])
+        a[4] = {'plain': {}}
+        b = pickle.loads(pickle.dumps(a))
+        self.assertEqual(b, a)
+        self.assertEqual(b[1][2].__class__, Counter)
+        self.assertEqual(b[1][2] + Counter(), Counter({'x': 1}))
+        self.assertEqual(list(b[1][3]), ['z', 'y'])
+        self.assertEqual(b[4].__class__, dict)
+
+        # deeper than the recursion limit
+        a = nested_dict.nested_dict()
+        node = a
+        for level in range(sys.getrecursionlimit() + 100):
+            node = node[level]
+        node['leaf'] = 1
+        self.assertEqual(list(pickle.loads(pickle.dumps(a)).values_flat()), [1])
+
+    def test_merge(self):
+        """Test merge with each on_conflict strategy."""
+        import nested_dict
+        a = nested_dict.nested_dict(3, int)
+        a['1']['2']['3'] = 3
+        a['A']['B']['C'] = 15
+        b = {'1': {'2': {'3': 5, '4': 4}}, 'X': {'Y': {'Z': 2}}}
+
+        for on_conflict, expected in (('overwrite', 5), ('sum', 8), ('max', 5), ('min', 3),
+                                      (lambda mine, other: mine * other, 15)):
+            c = nested_dict.nested_dict.from_items_flat(a.items_flat(), 3, int)
+            c.merge(b, on_conflict)
+            self.assertEqual(c.to_dict(), {'1': {'2': {'3': expected, '4': 4}},
+                                           'A': {'B': {'C': 15}}, 'X': {'Y': {'Z': 2}}})
+            # copied levels keep the nesting and type of values
+            self.assertEqual(c['X']['Y']['W'], 0)
+            self.assertFalse(c['X'] is b['X'])
+        self.assertRaises(ValueError, a.merge, b, 'unknown')
+
+        # levels only in other can be moved rather than copied
+        c = nested_dict.nested_dict()
+        c.merge(b, steal=True)
+        self.assertTrue(c['X'] is b['X'])
+
+        # collections are extended in place, without changing other
+        d = nested_dict.nested_dict(2, list)
+        d['1']['2'].append(1)
+        other = {'1': {'2': [2], '3': [3]}}
+        d.merge(other, 'extend')
+        d.merge(other, 'extend')
+        self.assertEqual(d.to_dict(), {'1': {'2': [1, 2, 2], '3': [3, 3]}})
+        self.assertEqual(other, {'1': {'2': [2], '3': [3]}})
+        e = nested_dict.nested_dict(2, set)
+        e['1']['2'].add(1)
+        e.merge({'1': {'2': set([2])}}, 'union')
+        self.assertEqual(e.to_dict(), {'1': {'2': set([1, 2])}})
+
+        # nothing is created in self except for keys in other
+        f = nested_dict.nested_dict()
+        f['1']['2'] = 1
+        f.merge({'1': {}, 'A': {'B': {}}})
+        self.assertEqual(f.to_dict(), {'1': {'2': 1}, 'A': {'B': {}}})
+
+    def test_merge_many(self):
+        """Test merge_many, serially and with a pool of worker processes."""
+        import nested_dict
+        a = nested_dict.nested_dict(3, int)
+        a['1']['2']['3'] = 3
+        a['A']['B']['C'] = 15
+        b = {'1': {'2': {'3': 1, '4': 4}}, 'X': {'Y': {'Z': 2}}}
+        expected = {'1': {'2': {'3': 7, '4': 4}}, 'A': {'B': {'C': 30}}, 'X': {'Y': {'Z': 2}}}
+        for workers in (None, 2):
+            merged = nested_dict.nested_dict.merge_many([a, b, a], workers=workers)
+            self.assertEqual(merged.to_dict(), expected)
+            # levels and type of values of the first dictionary
+            self.assertEqual(merged['new']['new']['new'], 0)
+        # inputs untouched
+        self.assertEqual(a.to_dict(), {'1': {'2': {'3': 3}}, 'A': {'B': {'C': 15}}})
+        self.assertEqual(b, {'1': {'2': {'3': 1, '4': 4}}, 'X': {'Y': {'Z': 2}}})
+
+        merged = nested_dict.nested_dict.merge_many([a, b], combine=max)
+        self.assertEqual(merged['1']['2']['3'], 3)
+        self.assertEqual(nested_dict.nested_dict.merge_many([]), {})
+
     def test_to_dict(self):
         """Test to_dict method."""
         import nested_dict
@@ -170,6 +444,56 @@ class Test_nested_dict_methods(unittest.TestCase):
         b = nested_dict.nested_dict(normal_dict)
         self.assertEqual(b, {'1': {'2': {'3': 3}}, 'A': {'B': 15}})
 
+    def test_to_dict_without_copy(self):
+        """Test to_dict(copy=False) removes default factories in place."""
+        import nested_dict
+        a = nested_dict.nested_dict()
+        a['1']['2']['3'] = 3
+        a['A']['B'] = 15
+        plain = a.to_dict(copy=False)
+        self.assertTrue(plain is a)
+        self.assertEqual(plain, {'1': {'2': {'3': 3}}, 'A': {'B': 15}})
+        self.assertRaises(KeyError, lambda: plain['X'])
+        self.assertRaises(KeyError, lambda: plain['1']['2']['X'])
+        self.assertEqual(a.to_dict(), {'1': {'2': {'3': 3}}, 'A': {'B': 15}})
+
+    def test_to_dict_deep_nesting(self):
+        """Test to_dict on trees nested deeper than the recursion limit."""
+        import nested_dict
+        a = nested_dict.nested_dict()
+        node = a
+        for level in range(sys.getrecursionlimit() + 100):
+            node = node[level]
+        node['leaf'] = 1
+        plain = a.to_dict()
+        while 'leaf' not in plain:
+            self.assertEqual(type(plain), dict)
+            plain = plain[next(iter(plain))]
+        self.assertEqual(plain, {'leaf': 1})
+
+    def test_from_dict(self):
+        """Test from_dict with a fixed level of nesting and type of values."""
+        import nested_dict
+        normal_dict = {'1': {'2': {'3': 3}}, 'A': {'B': {'C': 15, 'D': {'E': 1}}}}
+
+        a = nested_dict.nested_dict.from_dict(normal_dict, 3, int)
+        self.assertEqual(a, normal_dict)
+        a['X']['Y']['Z'] += 1
+        a['1']['2']['4'] += 1
+        self.assertEqual(a['1']['2'], {'3': 3, '4': 1})
+        # values which are dicts at the innermost level are left alone
+        self.assertEqual(type(a['A']['B']['D']), dict)
+
+        a = nested_dict.nested_dict.from_dict(normal_dict, 2)
+        self.assertRaises(KeyError, lambda: a['1']['2']['X'])
+        a['X']['Y'] = 1
+
+        a = nested_dict.nested_dict.from_dict(normal_dict)
+        self.assertEqual(a, normal_dict)
+        a['1']['X']['Y']['Z'] = 1
+        self.assertTrue(isinstance(a['A']['B'], nested_dict.nested_dict))
+        self.assertEqual(normal_dict, {'1': {'2': {'3': 3}}, 'A': {'B': {'C': 15, 'D': {'E': 1}}}})
+
     def test_str(self):
         """Test __str__ method."""
         import nested_dict
@@ -179,6 +503,514 @@ class Test_nested_dict_methods(unittest.TestCase):
         a['A']['B'] = 15
         self.assertEqual(json.loads(str(a)), {'1': {'2': {'3': 3}}, 'A': {'B': 15}})
 
+    def test_dump_json(self):
+        """Test dump_json method matches json.dumps of to_dict()."""
+        import nested_dict
+        import json
+        try:
+            from cStringIO import StringIO
+        except ImportError:
+            from io import StringIO
+        a = nested_dict.nested_dict()
+        a['1']['2']['3'] = 3
+        a['A']['B'] = 15.5
+        a['A']['C'] = [1, {'D': [2, 3]}, u'\xe9']
+        a[1][2.5] = None
+        a[True][None] = {}
+        a['empty']
+        a['\n"']['F'] = u'\u1234'
+        a[2 ** 70]['H'] = 2 ** 70
+        for indent in (None, 0, 2):
+            for chunk_size in (1, 65536):
+                fp = StringIO()
+                a.dump_json(fp, indent=indent, chunk_size=chunk_size)
+                self.assertEqual(fp.getvalue(), json.dumps(a.to_dict(), indent=indent))
+        fp = StringIO()
+        nested_dict.nested_dict().dump_json(fp)
+        self.assertEqual(fp.getvalue(), '{}')
+
+        a[(1, 2)]['G'] = 1
+        self.assertRaises(TypeError, a.dump_json, StringIO())
+
+    @unittest.skipIf(sys.version_info < (3, 6), "requires async generators")
+    def test_async(self):
+        """Test aitems_flat, akeys_flat and adump_json in an event loop."""
+        import nested_dict
+        import asyncio
+        import io
+        import json
+        a = nested_dict.nested_dict(3, int)
+        for key in range(25):
+            a[key % 3][key % 5][key] = key
+
+        class writer(object):
+            def __init__(self):
+                self.output = io.BytesIO()
+                self.drained = 0
+
+            def write(self, data):
+                self.output.write(data)
+
+            def drain(self):
+                self.drained += 1
+                # other tasks write meanwhile
+                a[9][9][self.drained] = 1
+                return asyncio.sleep(0)
+
+        def collect(async_iterator):
+            collected = []
+            try:
+                while True:
+                    collected.append(loop.run_until_complete(async_iterator.__anext__()))
+            except StopAsyncIteration:    # noqa: F821
+                return collected
+
+        loop = asyncio.new_event_loop()
+        try:
+            for yield_every in (1, 7, 25, 1000):
+                self.assertEqual(collect(a.aitems_flat(yield_every)), list(a.items_flat()))
+                self.assertEqual(collect(a.akeys_flat(yield_every)), list(a.keys_flat()))
+            self.assertRaises(ValueError, collect, a.aitems_flat(0))
+            # writes between batches are seen in levels not reached yet, without tracking
+            items = a.aitems_flat(1)
+            collected = [loop.run_until_complete(items.__anext__())]
+            self.assertEqual(collected, [((0, 0, 0), 0)])
+            del a[2][2]
+            a[1][1][1] = -1
+            a[2][3][8] = -8
+            a[8][8][8] = 8
+            expected = [item for item in a.items_flat() if item[0][0] != 8]
+            self.assertEqual(collected + collect(items), expected)
+            self.assertFalse(hasattr(a, '_parent') or hasattr(a[1], '_parent'))
+
+            # unless consistent, when writes between batches do not change what is returned
+            expected = list(a.items_flat())
+            items = a.aitems_flat(1, consistent=True)
+            collected = [loop.run_until_complete(items.__anext__())]
+            del a[0]
+            a[1][2][3] = -1
+            a[7][7][7] = 7
+            self.assertEqual(collected + collect(items), expected)
+            expected = list(a.keys_flat())
+            keys = a.akeys_flat(1, consistent=True)
+            collected = [loop.run_until_complete(keys.__anext__())]
+            del a[7]
+            self.assertEqual(collected + collect(keys), expected)
+
+            for consistent in (False, True):
+                expected = json.dumps(a.to_dict(), indent=2)
+                output = writer()
+                loop.run_until_complete(a.adump_json(output, indent=2, chunk_size=10,
+                                                     consistent=consistent))
+                self.assertEqual(output.output.getvalue().decode('utf-8'), expected)
+                self.assertTrue(output.drained > 1)
+                self.assertEqual(a[9][9][1], 1)
+                del a[9]
+        finally:
+            loop.close()
+
+    def test_load_json(self):
+        """Test load_json builds nested_dicts with the right levels and type of values."""
+        import nested_dict
+        import io
+        a = nested_dict.nested_dict(3, int)
+        a['1']['2']['3'] = 3
+        a['A']['B']['C'] = 15
+        a['empty']['level']
+
+        b = nested_dict.nested_dict.load_json(io.StringIO(u'%s' % a), 3, int)
+        self.assertEqual(b, a)
+        self.assertTrue(isinstance(b, nested_dict.nested_dict))
+        b['X']['Y']['Z'] += 1
+        b['1']['2']['4'] += 1
+        self.assertEqual(b['X']['Y']['Z'], 1)
+        self.assertRaises(TypeError, lambda: b['X']['Y']['Z']['W'])
+
+        b = nested_dict.nested_dict.load_json(io.StringIO(u'{"1": {"2": {"3": 3}}}'), 2)
+        b['X']['Y'] = 1
+        self.assertRaises(KeyError, lambda: b['X']['Z'])
+
+        b = nested_dict.nested_dict.load_json(io.StringIO(u'{"1": {"2": 3}, "A": [1, 2]}'))
+        b['1']['X']['Y'] = 4
+        self.assertEqual(b.to_dict(), {'1': {'2': 3, 'X': {'Y': 4}}, 'A': [1, 2]})
+
+        self.assertRaises(ValueError, nested_dict.nested_dict.load_json, io.StringIO(u'[1]'))
+
+        # objects in arrays are plain dicts, as for nested_dict(json.load(fp))
+        text = u'{"1": {"2": [{"3": {"4": 5}}, [{"6": 7}]]}}'
+        for levels in (None, 3):
+            b = nested_dict.nested_dict.load_json(io.StringIO(text), levels)
+            array = b['1']['2']
+            self.assertEqual(array, [{'3': {'4': 5}}, [{'6': 7}]])
+            self.assertEqual(array[0].__class__, dict)
+            self.assertEqual(array[0]['3'].__class__, dict)
+            self.assertEqual(array[1][0].__class__, dict)
+
+        # objects deeper than levels are plain dicts, as for from_dict(), also once pickled
+        import json
+        import pickle
+        text = u'{"a": {"b": {"c": {"d": {"e": 1}}}}}'
+        for levels in (2, 3):
+            b = nested_dict.nested_dict.load_json(io.StringIO(text), levels)
+            path = ('a', 'b', 'c')[:levels]
+            self.assertEqual(b.get_path(path).__class__, dict)
+            self.assertEqual(list(b.get_path(path).values())[0].__class__, dict)
+            from_dict = nested_dict.nested_dict.from_dict(json.loads(text), levels)
+            self.assertEqual(b.get_path(path), from_dict.get_path(path))
+            copied = pickle.loads(pickle.dumps(b))
+            self.assertRaises(KeyError, lambda: copied.get_path(path)['missing'])
+
+    def test_aggregate(self):
+        """Test aggregate, with and without cached aggregates."""
+        import nested_dict
+        import pickle
+        nd = nested_dict.nested_dict(3, int)
+        nd['a']['b']['c'] = 3
+        nd['a']['b']['d'] = 5
+        nd['x']['y']['z'] = -1
+        for cached in (False, True):
+            nd.cache_aggregates(cached)
+            self.assertEqual(nd.aggregate(), 7)
+            self.assertEqual(nd.aggregate(('a',), 'max'), 5)
+            self.assertEqual(nd.aggregate(how='min'), -1)
+            self.assertEqual(nd.aggregate(('a', 'b', 'c'), 'count'), 1)
+            self.assertRaises(KeyError, nd.aggregate, ('q',))
+            self.assertRaises(ValueError, nd.aggregate, (), 'mean')
+        self.assertRaises(ValueError, nested_dict.nested_dict().aggregate, (), 'max')
+
+        # writes invalidate cached aggregates
+        nd['a']['b']['c'] += 10
+        self.assertEqual(nd.aggregate(), 17)
+        nd['q']['r']['s'] = 100
+        self.assertEqual(nd.aggregate(how='max'), 100)
+        del nd['q']
+        self.assertEqual(nd.aggregate(how='max'), 13)
+        nd['a'].setdefault('n', {'m': 1})
+        nd.update({'x': {'y': {'z': 0}}})
+        self.assertEqual(nd.aggregate(how='count'), 4)
+        self.assertEqual(nd.aggregate(), 19)
+        # plain dicts are never cached
+        nd['a']['n']['m'] = 2
+        self.assertEqual(nd.aggregate(), 20)
+
+        # tracking is not pickled
+        nd2 = pickle.loads(pickle.dumps(nd))
+        self.assertEqual(nd2, nd)
+        self.assertEqual(nd2.__class__, nested_dict.nested_dict)
+        nd.cache_aggregates(False)
+        self.assertEqual(nd.__class__, nested_dict.nested_dict)
+        self.assertEqual(nd.aggregate(), 20)
+
+    def test_sizes(self):
+        """Test len_flat and level_sizes, with and without counting sizes."""
+        import nested_dict
+        nd = nested_dict.nested_dict(3, int)
+        nd['a']['b']['c'] = 3
+        nd['a']['b']['d'] = 5
+        nd['x']['y']['z'] = -1
+        self.assertEqual(nd.len_flat(), 3)
+        self.assertEqual(nd.level_sizes(), [2, 2, 3])
+        nd.count_sizes()
+        self.assertEqual(nd.len_flat(), 3)
+
+        # all writes update the counts, at every tracked level
+        nd['a']['e']['f'] += 1
+        nd['a']['b']['c'] += 1
+        self.assertEqual(nd.level_sizes(), [2, 3, 4])
+        self.assertEqual(nd['a'].level_sizes(), [2, 3])
+        nd['x'].pop('y')
+        nd['a']['b'].clear()
+        self.assertEqual(nd.level_sizes(), [2, 2, 1])
+        nd.update({'p': {'q': {'r': 1, 's': 2}}})
+        nd['a'].setdefault('n', 7)
+        self.assertEqual(nd.level_sizes(), [3, 4, 3])
+        self.assertEqual(nd.len_flat(), 4)
+        del nd['p']
+        nd['a']['b'] = 2
+        self.assertEqual((nd.len_flat(), nd.level_sizes()), (3, [2, 3, 1]))
+        nd.popitem()
+        self.assertEqual(nd.len_flat(), nested_dict.nested_dict(nd.to_dict()).len_flat())
+
+        # writes to levels removed from the dictionary are not counted
+        nd.update({'p': {'q': {'r': 1}}, 'w': {'v': {'u': 1}}})
+        sizes = nd.level_sizes()
+        removed = nd.pop('p')
+        replaced = nd['w']
+        nd['w'] = {'v': {'u': 1}}
+        removed['q']['s'] = 5
+        replaced['t']['s'] = 5
+        self.assertEqual(nd.level_sizes(), [sizes[0] - 1, sizes[1] - 1, sizes[2] - 1])
+        self.assertEqual(nd.len_flat(), nested_dict.nested_dict(nd.to_dict()).len_flat())
+        nd.count_sizes(False)
+        self.assertEqual(nd.__class__, nested_dict.nested_dict)
+        self.assertEqual(nested_dict.nested_dict().level_sizes(), [])
+
+    def test_snapshot(self):
+        """Test that snapshots are unchanged by later writes, which copy only the levels written."""
+        import nested_dict
+        import pickle
+        nd = nested_dict.nested_dict(3, int)
+        nd['a']['b']['c'] = 3
+        nd['a']['b']['d'] = 5
+        nd['x']['y']['z'] = -1
+        first = nd.snapshot()
+        expected = nd.to_dict()
+        nd['a']['b']['c'] += 10
+        second = nd.snapshot()
+        nd['a']['e']['f'] = 1
+        moved = nd.pop('x')
+        moved['y']['z'] = 0
+        nd['q'] = moved
+        nd['a']['b'].clear()
+        nd.update({'a': {'b': {'c': 7}}})
+        self.assertEqual(first.to_dict(), expected)
+        self.assertEqual(first, expected)
+        self.assertEqual(second['a']['b']['c'], 13)
+        self.assertEqual(sorted(second.items_flat()),
+                         [(('a', 'b', 'c'), 13), (('a', 'b', 'd'), 5), (('x', 'y', 'z'), -1)])
+        self.assertEqual(second.get_path(('x', 'y')), {'z': -1})
+        self.assertFalse('q' in second)
+        self.assertRaises(KeyError, lambda: second['a']['e'])
+        self.assertEqual(nd.to_dict(), {'a': {'b': {'c': 7}, 'e': {'f': 1}}, 'q': {'y': {'z': 0}}})
+        # unchanged levels are shared, not copied
+        self.assertEqual(nd['a']['e']._history, None)
+
+        # a level's snapshot, and snapshots are not pickled
+        inner = nd['a'].snapshot()
+        nd['a']['e']['f'] = 2
+        self.assertEqual(inner['e']['f'], 1)
+        # snapshots of another dictionary do not copy levels again
+        history = nd['a']['e']._history
+        other = nested_dict.nested_dict(2, int)
+        other['x']['y'] = 1
+        other_snapshot = other.snapshot()
+        nd['a']['e']['f'] = 3
+        self.assertTrue(nd['a']['e']._history is history)
+        self.assertEqual(inner['e']['f'], 1)
+        other['x']['y'] = 2
+        self.assertEqual(other_snapshot['x']['y'], 1)
+        self.assertEqual(pickle.loads(pickle.dumps(nd)), nd)
+        self.assertEqual(pickle.loads(pickle.dumps(nd)).__class__, nested_dict.nested_dict)
+
+        # levels moved between snapshotted parents keep the copies older snapshots read
+        nd = nested_dict.nested_dict()
+        nd['a']['x']['k'] = 1
+        first = nd['a'].snapshot()
+        nd['a']['x']['k'] = 2
+        nd['b']['x'] = nd['a'].pop('x')
+        second = nd.snapshot()
+        nd['b']['x']['k'] = 3
+        nd['c'] = nd['b'].pop('x')
+        third = nd['b'].snapshot()
+        nd['c']['k'] = 4
+        self.assertEqual(first.to_dict(), {'x': {'k': 1}})
+        self.assertEqual(second.to_dict(), {'a': {}, 'b': {'x': {'k': 2}}})
+        self.assertEqual(third.to_dict(), {})
+        self.assertEqual(nd.to_dict(), {'a': {}, 'b': {}, 'c': {'k': 4}})
+
+    def test_digest(self):
+        """Test digest, with and without cached digests, and digest_equal."""
+        import nested_dict
+        import decimal
+        import pickle
+        nd = nested_dict.nested_dict(3, int)
+        nd['a']['b']['c'] = 1
+        nd['a']['b']['d'] = 2.5
+        nd['x']['y']['z'] = 'z'
+        nd['k'] = (1, 2)
+        other = pickle.loads(pickle.dumps(nd))
+        self.assertEqual(nd.digest(), other.digest())
+        self.assertEqual(len(nd.digest()), 20)
+        other['a']['b']['c'] = 2
+        self.assertNotEqual(nd.digest(), other.digest())
+        self.assertNotEqual(nd.digest(('a',)), other.digest(('a',)))
+        self.assertEqual(nd.digest(('x',)), other.digest(('x',)))
+        self.assertEqual(nd.digest(('k',)), other.digest(('k',)))
+        self.assertRaises(KeyError, nd.digest, ('q',))
+        self.assertFalse('q' in nd)
+
+        for dictionary in (nd, other):
+            dictionary.cache_digests()
+            dictionary.digest()
+        self.assertFalse(nd.digest_equal(other))
+        self.assertFalse(nd == other)
+        other['a']['b']['c'] = 1
+        self.assertTrue(nd['a']['b']._digest is not None)
+        self.assertEqual(other._digest, None)
+        self.assertEqual(other['x']._digest, nd['x']._digest)
+        self.assertEqual(other.digest(), nd.digest())
+        self.assertTrue(nd.digest_equal(other))
+        self.assertTrue(nd.digest_equal(other, ('x', 'y')))
+        self.assertTrue(nd == other)
+        self.assertFalse(nd != other)
+        # same digests after writes, as for digests made afresh
+        nd['a']['e']['f'] = 7
+        self.assertEqual(nd.digest(), pickle.loads(pickle.dumps(nd)).digest())
+        self.assertFalse(nd == other)
+        nd.cache_digests(False)
+        self.assertEqual(nd.__class__, nested_dict.nested_dict)
+
+        # equal values of different types have equal digests
+        numbers = nested_dict.nested_dict()
+        numbers['a'][1] = 1
+        floats = nested_dict.nested_dict()
+        floats['a'][1.0] = 1.0
+        self.assertEqual(numbers.digest(), floats.digest())
+        floats['a'][1.0] = 1.5
+        self.assertNotEqual(numbers.digest(), floats.digest())
+
+        # leaves changed in place leave cached digests stale, and == does not use digests
+        lists = nested_dict.nested_dict()
+        lists['a']['b'] = [1]
+        other_lists = pickle.loads(pickle.dumps(lists))
+        for dictionary in (lists, other_lists):
+            dictionary.cache_digests()
+            dictionary.digest()
+        lists['a']['b'].append(2)
+        self.assertTrue(lists.digest_equal(other_lists))
+        self.assertFalse(lists == other_lists)
+        other_lists['a']['b'] = [1, 3]
+        self.assertFalse(lists.digest_equal(other_lists))
+        other_lists['a']['b'][1] = 2
+        self.assertTrue(lists == other_lists)
+        self.assertEqual(lists.to_dict(), other_lists.to_dict())
+
+        # equal values with different repr() compare equal, but have different digests
+        times = nested_dict.nested_dict()
+        times['a']['b'] = decimal.Decimal('1.10')
+        other_times = nested_dict.nested_dict()
+        other_times['a']['b'] = decimal.Decimal('1.1')
+        for dictionary in (times, other_times):
+            dictionary.cache_digests()
+            dictionary.digest()
+        self.assertTrue(times == other_times)
+        self.assertFalse(times.digest_equal(other_times))
+
+    def test_diff(self):
+        """Test that apply_patch(diff()) turns one nested_dict into another, via JSON."""
+        import nested_dict
+        import json
+        import pickle
+        nd = nested_dict.nested_dict(3, int)
+        nd['a']['b']['c'] = 1
+        nd['a']['b']['d'] = 2
+        nd['x']['y']['z'] = 3
+        nd['k'] = 4
+        other = pickle.loads(pickle.dumps(nd))
+        other['a']['b']['c'] = 10
+        del other['a']['b']['d']
+        other['n']['m']['o'] = 5
+        other['k'] = {'deep': 6}
+        patch = nd.diff(other)
+        self.assertEqual(sorted(patch),
+                         [('add', ('n',), {'m': {'o': 5}}),
+                          ('change', ('a', 'b', 'c'), 10),
+                          ('change', ('k',), {'deep': 6}),
+                          ('remove', ('a', 'b', 'd'))])
+        self.assertEqual(nd.diff(nd), [])
+        self.assertEqual(sorted(nd.freeze().diff(other.freeze())), sorted(patch))
+        nd.apply_patch(json.loads(json.dumps(patch)))
+        self.assertEqual(nd, other)
+        nd['n']['m']['p'] = 1
+        self.assertEqual(nd.get_path(('n', 'm', 'q')), None)
+        self.assertEqual(nd['n']['m']['q'], 0)
+        self.assertRaises(KeyError, nd.apply_patch, [('remove', ('a', 'e'))])
+
+    def test_index(self):
+        """Test lookup, with and without an index."""
+        import nested_dict
+        nd = nested_dict.nested_dict(3, int)
+        nd['new jersey']['mercer county']['plumbers'] = 3
+        nd['new jersey']['mercer county']['programmers'] = 81
+        nd['new jersey']['middlesex county']['programmers'] = 81
+        nd['new york']['queens county']['plumbers'] = 9
+        for indexed in (False, True):
+            if indexed:
+                nd.create_index(2)
+                nd.create_index(0)
+            self.assertEqual(sorted(nd.lookup(2, 'plumbers')),
+                             [('new jersey', 'mercer county', 'plumbers'),
+                              ('new york', 'queens county', 'plumbers')])
+            self.assertEqual(nd.lookup(1, 'queens county', items=True),
+                             [(('new york', 'queens county'), {'plumbers': 9})])
+            self.assertEqual(nd.lookup(0, 'ohio'), [])
+
+        # indexes follow writes
+        nd['ohio']['franklin county']['plumbers'] += 1
+        del nd['new jersey']['mercer county']
+        nd.update({'maine': {'york county': {'plumbers': 1}}})
+        nd['new york'].pop('queens county')
+        self.assertEqual(sorted(nd.lookup(2, 'plumbers')),
+                         [('maine', 'york county', 'plumbers'),
+                          ('ohio', 'franklin county', 'plumbers')])
+        self.assertEqual(nd.lookup(2, 'programmers'),
+                         [('new jersey', 'middlesex county', 'programmers')])
+        self.assertEqual(sorted(nd.lookup(0, 'ohio')), [('ohio',)])
+        nd.drop_index(2)
+        nd.drop_index(0)
+        self.assertRaises(KeyError, nd.drop_index, 0)
+        self.assertEqual(nd.__class__, nested_dict.nested_dict)
+        self.assertEqual(len(nd.lookup(2, 'plumbers')), 2)
+
+        # levels removed (or replaced) are no longer indexed when written to
+        nd.create_index(2)
+        removed = [nd['ohio'], nd['maine'], nd['new york'], nd['new jersey']]
+        del nd['ohio']
+        nd.pop('maine')
+        nd['new york'] = {}
+        nd.clear()
+        for level in removed:
+            level['hudson county']['plumbers'] = 5
+        self.assertEqual(nd.lookup(2, 'plumbers'), [])
+        self.assertEqual(nd.lookup(2, 'plumbers', items=True), [])
+
+    def test_save_and_open(self):
+        """Test binary snapshots."""
+        import nested_dict
+        import tempfile
+        import shutil
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, "snapshot")
+            nd = nested_dict.nested_dict(3, int)
+            nd['new jersey']['mercer county']['plumbers'] = 3
+            nd['new jersey']['middlesex county']['programmers'] = 81
+            nd['new york']['queens county']['plumbers'] = 9
+            nd.save(filename)
+            with nested_dict.nested_dict.open(filename) as snapshot:
+                self.assertEqual(sorted(snapshot), ['new jersey', 'new york'])
+                self.assertEqual(snapshot['new york'], {'queens county': {'plumbers': 9}})
+                # read-only
+                self.assertRaises(KeyError, lambda: snapshot['new york']['kings county'])
+                self.assertRaises(TypeError, snapshot['new york'].__setitem__, 'x', {})
+                self.assertEqual(sorted(snapshot.items_flat())[0],
+                                 (('new jersey', 'mercer county', 'plumbers'), 3))
+                self.assertRaises(KeyError, lambda: snapshot['ohio'])
+                loaded = snapshot.load()
+                # nested levels are as saved, and not shared with the snapshot
+                loaded['new york']['queens county']['plumbers'] += 1
+                self.assertEqual(loaded['new york']['kings county']['plumbers'], 0)
+                self.assertEqual(snapshot['new york'], {'queens county': {'plumbers': 9}})
+                self.assertEqual(snapshot.load()['new york'], {'queens county': {'plumbers': 9}})
+            self.assertTrue(isinstance(loaded, nested_dict.nested_dict))
+            self.assertEqual(loaded['new jersey'], nd['new jersey'])
+
+            from collections import Counter
+            nd = nested_dict.nested_dict({'a': {'b': [1]}, 'c': 2})
+            nd['a']['d'] = nd['e'] = Counter('x')
+            nd.save(filename)
+            with nested_dict.nested_dict.open(filename) as snapshot:
+                self.assertEqual(snapshot.to_dict(), {'a': {'b': [1], 'd': {'x': 1}}, 'c': 2,
+                                                      'e': {'x': 1}})
+                # other mappings are values, unchanged
+                self.assertEqual(snapshot['a']['d'].__class__, Counter)
+                self.assertEqual(snapshot['e'].__class__, Counter)
+            self.assertRaises(ValueError, nested_dict.nested_dict.open, __file__)
+            open(filename, 'w').close()
+            self.assertRaises(ValueError, nested_dict.nested_dict.open, filename)
+        finally:
+            shutil.rmtree(directory)
+
     def test_update(self):
         """Test update method."""
         import nested_dict
@@ -243,3 +1075,298 @@ class Test_nested_dict_methods(unittest.TestCase):
         # d1[2][3][4][5] = 6 but d1[2][3][5] should still be a default dict of list
         d1[2][3][5].append(4)
         self.assertEqual(d1.to_dict(), {1: {2: {3: [4], 4: [4]}}, 2: {3: {4: {5: 6}, 5: [4]}}})
+
+
+class Test_flat_nested_dict(unittest.TestCase):
+    """Test flat_nested_dict, the tuple-keyed storage backend."""
+
+    def test_nested_access(self):
+        """Test that levels behave as for nested_dict."""
+        from nested_dict import flat_nested_dict
+        nd = flat_nested_dict(3, int)
+        nd['new jersey']['mercer county']['plumbers'] += 3
+        nd['new jersey']['mercer county']['programmers'] += 81
+        nd['new york']['queens county']['plumbers'] = 9
+        self.assertEqual(nd['new jersey']['mercer county']['plumbers'], 3)
+        self.assertEqual(sorted(nd), ['new jersey', 'new york'])
+        self.assertEqual(len(nd['new jersey']['mercer county']), 2)
+        self.assertTrue('new york' in nd)
+        self.assertFalse('ohio' in nd)
+        # reading a missing level does not create it
+        nd['ohio']['franklin county']
+        self.assertFalse('ohio' in nd)
+        self.assertEqual(nd.get('ohio'), None)
+
+        nd2 = flat_nested_dict(2)
+        nd2[1][2] = "a"
+        self.assertRaises(KeyError, lambda: nd2[1][3])
+
+    def test_flat_api(self):
+        """Test items_flat, keys_flat, values_flat and to_dict."""
+        from nested_dict import flat_nested_dict
+        nd = flat_nested_dict(2, list)
+        nd['new jersey']['mercer county'].append('plumbers')
+        nd['new jersey']['middlesex county'].append('salesmen')
+        nd['new york']['queens county'].append('cricketers')
+        self.assertEqual(sorted(nd.items_flat()),
+                         [(('new jersey', 'mercer county'), ['plumbers']),
+                          (('new jersey', 'middlesex county'), ['salesmen']),
+                          (('new york', 'queens county'), ['cricketers'])])
+        self.assertEqual(sorted(nd['new jersey'].keys_flat()),
+                         [('mercer county',), ('middlesex county',)])
+        self.assertEqual(sorted(nd.values_flat()), [['cricketers'], ['plumbers'], ['salesmen']])
+        self.assertEqual(nd.to_dict(), {"new jersey": {"mercer county": ["plumbers"],
+                                                       "middlesex county": ["salesmen"]},
+                                        "new york": {"queens county": ["cricketers"]}})
+        self.assertEqual(nd, nd.to_dict())
+        self.assertEqual(sorted(nd.keys_at_level(0)), [('new jersey',), ('new york',)])
+        self.assertEqual(sorted((keys, level.to_dict()) for keys, level
+                                in nd.items_flat(prefix=('new jersey',), max_depth=1)),
+                         [(('new jersey',), {"mercer county": ["plumbers"],
+                                             "middlesex county": ["salesmen"]})])
+
+    def test_set_and_delete_levels(self):
+        """Test assigning and deleting whole levels."""
+        from nested_dict import flat_nested_dict
+        nd = flat_nested_dict(3, int)
+        nd[1][2][3] = 4
+        nd[1][5] = {6: 7, 8: 9}
+        self.assertEqual(nd.to_dict(), {1: {2: {3: 4}, 5: {6: 7, 8: 9}}})
+        del nd[1][2]
+        self.assertEqual(nd.to_dict(), {1: {5: {6: 7, 8: 9}}})
+        self.assertRaises(KeyError, nd.__delitem__, 2)
+        self.assertRaises(ValueError, nd.__setitem__, 2, 3)
+        self.assertRaises(ValueError, nd.__setitem__, 2, {3: 4})
+
+        # the counts of keys in each level follow writes and deletes
+        nd[1][5][10] += 1
+        nd[7][8][9] = 1
+        self.assertEqual((len(nd), len(nd[1]), len(nd[1][5]), len(nd[7][8])), (2, 1, 3, 1))
+        nd[1][5] = {6: 1}
+        del nd[7][8][9]
+        self.assertEqual((len(nd), len(nd[1][5]), len(nd[7])), (1, 1, 0))
+        self.assertFalse(7 in nd)
+        self.assertEqual(nd.get_path((7, 8)), None)
+        nd[1].clear()
+        self.assertEqual((len(nd), len(nd[1])), (0, 0))
+        self.assertFalse(1 in nd)
+        self.assertEqual(nd._counts, {})
+
+    def test_path_methods(self):
+        """Test path methods, which are single lookups in the flat storage."""
+        from nested_dict import flat_nested_dict
+        nd = flat_nested_dict(3, int)
+        nd.set_path((1, 2, 3), 4)
+        nd.path[1, 2, 5] = 6
+        self.assertEqual(nd.get_path((1, 2, 3)), 4)
+        self.assertEqual(nd.get_path((1, 2)), {3: 4, 5: 6})
+        self.assertEqual(nd.get_path((9, 9)), None)
+        self.assertTrue((1, 2, 5) in nd.path)
+        self.assertEqual(nd.setdefault_path((1, 2, 7), 8), 8)
+        nd.del_path((1, 2, 3))
+        self.assertRaises(KeyError, nd.del_path, (1, 2, 3))
+        self.assertEqual(nd.to_dict(), {1: {2: {5: 6, 7: 8}}})
+
+
+class Test_sorted_nested_dict(unittest.TestCase):
+    """Test sorted_nested_dict, iterated in key order."""
+
+    def test_ranges(self):
+        """Test ordered iteration, irange_flat and first_n, as keys are added and removed."""
+        from nested_dict import sorted_nested_dict
+        nd = sorted_nested_dict(3, int)
+        days = ['2026-10-%02d' % day for day in (9, 3, 1, 7, 5, 8)]
+        for day in days:
+            for host in ('c', 'a', 'b'):
+                nd[day][host]['errors'] += 1
+        expected = sorted((day, host, 'errors') for day in days for host in 'abc')
+        self.assertEqual(list(nd.keys_flat()), expected)
+        self.assertEqual(list(nd), sorted(days))
+        self.assertEqual([path for path, value in nd.irange_flat(('2026-10-01',), ('2026-10-07',))],
+                         expected[:12])
+        self.assertEqual([path for path, value in
+                          nd.irange_flat(('2026-10-01',), ('2026-10-07', 'b'), (False, False))],
+                         expected[3:10])
+        self.assertEqual(list(nd.irange_flat(hi=('2026-10-01', 'a'))), [(expected[0], 1)])
+        self.assertEqual(list(nd['2026-10-03'].irange_flat(('b',))),
+                         [(('b', 'errors'), 1), (('c', 'errors'), 1)])
+        self.assertEqual(nd.first_n(2), [(expected[0], 1), (expected[1], 1)])
+        self.assertEqual(nd['2026-10-09'].first_n(5), [((host, 'errors'), 1) for host in 'abc'])
+
+        del nd['2026-10-01']
+        del nd['2026-10-03']['a']['errors']
+        nd['2026-10-02'] = {'z': {'errors': 2}}
+        self.assertEqual(nd.first_n(2), [(('2026-10-02', 'z', 'errors'), 2),
+                                         (('2026-10-03', 'b', 'errors'), 1)])
+        self.assertFalse('2026-10-01' in nd)
+        self.assertEqual(len(nd), 6)
+        self.assertEqual(list(nd.irange_flat(('2026-10-10',))), [])
+
+
+class Test_disk_nested_dict(unittest.TestCase):
+    """Test disk_nested_dict, the SQLite storage backend."""
+
+    def setUp(self):
+        """Make a temporary directory for the database file."""
+        import tempfile
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "nested_dict.db")
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        import shutil
+        shutil.rmtree(self.directory)
+
+    def test_nested_access(self):
+        """Test that levels behave as for nested_dict, and are kept in the file."""
+        from nested_dict import disk_nested_dict
+        nd = disk_nested_dict(self.filename, 3, int, cache_size=2, batch_size=3)
+        nd['new jersey']['mercer county']['plumbers'] += 3
+        nd['new jersey']['mercer county']['programmers'] += 81
+        nd['new york']['queens county']['plumbers'] = 9
+        nd['ohio'] = {'franklin county': {'salesmen': 1, 'plumbers': 2}}
+        del nd['new jersey']['mercer county']['programmers']
+        self.assertEqual(nd['new jersey']['mercer county']['plumbers'], 3)
+        self.assertEqual(sorted(nd), ['new jersey', 'new york', 'ohio'])
+        self.assertFalse('texas' in nd)
+        nd.close()
+
+        with disk_nested_dict(self.filename, 3, list) as nd:
+            self.assertEqual(nd.to_dict(),
+                             {'new jersey': {'mercer county': {'plumbers': 3}},
+                              'new york': {'queens county': {'plumbers': 9}},
+                              'ohio': {'franklin county': {'salesmen': 1, 'plumbers': 2}}})
+            # values changed in place are written back
+            nd['texas']['harris county']['plumbers'].append(1)
+            nd['texas']['harris county']['plumbers'].append(2)
+            del nd['ohio']
+        with disk_nested_dict(self.filename, 3) as nd:
+            self.assertEqual(sorted(nd.items_flat()),
+                             [(('new jersey', 'mercer county', 'plumbers'), 3),
+                              (('new york', 'queens county', 'plumbers'), 9),
+                              (('texas', 'harris county', 'plumbers'), [1, 2])])
+            self.assertRaises(KeyError, lambda: nd['ohio']['franklin county']['salesmen'])
+        self.assertRaises(ValueError, disk_nested_dict, self.filename, 2)
+
+    def test_prefixes_as_other_backends(self):
+        """Test that items_flat(prefix) gives the same for every backend, down to the values."""
+        import nested_dict
+        backends = [nested_dict.nested_dict(3, int), nested_dict.flat_nested_dict(3, int),
+                    nested_dict.sorted_nested_dict(3, int),
+                    nested_dict.disk_nested_dict(self.filename, 3, int)]
+        if numpy is not None:
+            backends.append(nested_dict.array_nested_dict(3, int))
+        prefixes = [(), ('a',), ('a', 'b'), ('a', 'b', 'c'), ('a', 'b', 'x'), ('a', 'b', 'c', 'd'),
+                    ('z', 'y', 'x')]
+        for nd in backends:
+            nd['a']['b']['c'] = 1
+            nd['a']['b']['d'] = 2
+            nd['a']['e']['f'] = 3
+            for prefix in prefixes:
+                self.assertEqual(sorted(nd.items_flat(prefix=prefix)),
+                                 sorted(backends[0].items_flat(prefix=prefix)))
+                self.assertEqual(sorted(nd.keys_flat(prefix=prefix, max_depth=2)),
+                                 sorted(backends[0].keys_flat(prefix=prefix, max_depth=2)))
+            self.assertEqual(list(nd['a']['b'].items_flat(prefix=('c',))), [(('c',), 1)])
+            self.assertFalse('z' in nd)
+        backends[3].close()
+
+
+class Test_concurrent_nested_dict(unittest.TestCase):
+    """Test concurrent_nested_dict, written from many threads."""
+
+    def test_threads(self):
+        """Test that no increments or levels are lost when threads write at once."""
+        import pickle
+        import threading
+        from nested_dict import concurrent_nested_dict
+        nd = concurrent_nested_dict(3, int, stripes=4)
+        paths = [(a, b, c) for a in range(10) for b in range(10) for c in range(10)]
+
+        def increment():
+            for path in paths:
+                nd.incr_path(path)
+                nd.setdefault_path(path[:2] + ('total',), 0)
+        threads = [threading.Thread(target=increment) for thread in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sum(nd[a][b][c] for a, b, c in paths), 4 * len(paths))
+        self.assertEqual(len(nd[9][9]), 11)
+
+        # including nested levels created on access, or copied in
+        nd[10][0]['x'] = 1
+        self.assertEqual(nd.incr_path((11, 'y', 'z'), 2), 2)
+        self.assertEqual(nd[10].__class__, nd[11]['y'].__class__)
+        copied = concurrent_nested_dict({'y': {'z': 1}})
+        self.assertEqual(copied['y'].__class__, nd[10].__class__)
+        self.assertEqual(copied['x']['y'].__class__, nd[10].__class__)
+        nd.del_path((10, 0))
+        self.assertRaises(KeyError, nd.del_path, (10, 0))
+        copy = pickle.loads(pickle.dumps(nd))
+        self.assertEqual(copy, nd)
+        self.assertEqual(copy.incr_path((11, 'y', 'z')), 3)
+
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+@unittest.skipIf(numpy is None, "requires numpy")
+class Test_array_nested_dict(unittest.TestCase):
+    """Test array_nested_dict, which holds values in numpy arrays."""
+
+    def test_nested_access(self):
+        """Test that levels behave as for nested_dict(levels, int)."""
+        from nested_dict import array_nested_dict
+        nd = array_nested_dict(3, int)
+        nd['new jersey']['mercer county']['plumbers'] += 3
+        nd['new jersey']['mercer county']['programmers'] = 81
+        nd['new york']['queens county']['plumbers'] += 9
+        self.assertEqual(nd['new jersey']['mercer county']['plumbers'], 3)
+        self.assertEqual(nd.to_dict(), {'new jersey': {'mercer county': {'plumbers': 3,
+                                                                         'programmers': 81}},
+                                        'new york': {'queens county': {'plumbers': 9}}})
+        del nd['new jersey']['mercer county']['plumbers']
+        del nd['new york']['queens county']['plumbers']
+        self.assertFalse('new york' in nd)
+        # the freed slot is reused
+        nd['new jersey']['mercer county']['salesmen'] = 62
+        self.assertEqual(sorted(nd.items_flat()),
+                         [(('new jersey', 'mercer county', 'programmers'), 81),
+                          (('new jersey', 'mercer county', 'salesmen'), 62)])
+
+    def test_add_many(self):
+        """Test vectorised add_many, subtree_sum and to_arrays."""
+        from nested_dict import array_nested_dict
+        nd = array_nested_dict(2)
+        nd.add_many([(1, 2), (1, 3), (1, 2), (4, 5)], numpy.array([1.0, 2.0, 3.0, 4.0]))
+        nd[1].add_many([(2,), (6,)], 0.5)
+        self.assertEqual(nd.to_dict(), {1: {2: 4.5, 3: 2.0, 6: 0.5}, 4: {5: 4.0}})
+        self.assertEqual(nd.subtree_sum(), 11.0)
+        self.assertEqual(nd.subtree_sum((1,)), 7.0)
+        self.assertEqual(nd[1].subtree_sum((3,)), 2.0)
+        self.assertEqual(nd.subtree_sum((7,)), 0.0)
+        # prefixes down to (and past) the values
+        self.assertEqual(nd.subtree_sum((1, 2)), 4.5)
+        self.assertEqual(nd[1].subtree_sum((2,)), 4.5)
+        self.assertEqual(nd.subtree_sum((1, 2, 3)), 0.0)
+        self.assertEqual(nd.subtree_sum((1, 7)), 0.0)
+        self.assertFalse(7 in nd)
+        keys, values = nd[1].to_arrays()
+        self.assertEqual(sorted(zip(keys, values.tolist())),
+                         [((2,), 4.5), ((3,), 2.0), ((6,), 0.5)])
+        self.assertRaises(ValueError, nd.add_many, [(1, 2)], [1.0, 2.0])
+        self.assertRaises(ValueError, nd.add_many, [(1, 2, 3)], [1.0])
+
+        # each value goes to its own path, whatever the order of the paths in a dict
+        paths = [('k%d' % (i % 7), 'v%d' % (i * 37 % 101)) for i in range(300)]
+        many = array_nested_dict(2)
+        many.add_many(paths, numpy.arange(300.0))
+        expected = {}
+        for value, path in enumerate(paths):
+            expected[path] = expected.get(path, 0.0) + value
+        self.assertEqual(dict(many.items_flat()), expected)